@@ -1,17 +1,64 @@
-from contextlib import contextmanager
-from typing import List, Optional, Type, TypeVar
+import importlib
+from contextlib import asynccontextmanager, contextmanager
+from typing import Iterable, List, Optional, Sequence, Type, TypeVar
+from sqlalchemy import inspect, literal_column, text, update
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from sqlalchemy.sql import func
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 import logging
 import sys
-from database import SessionLocal, Base
-from models import Adam 
+from database import Base, get_async_session_factory, get_engine, get_session_factory
+from metrics import STAGE_ERRORS, timed_stage
+from models import Adam, AdamSnapshot, M2SheetRow, OrderState, OrdersSheetRow, SyncState
+
+logger = logging.getLogger(__name__)
 
 # Generic type for SQLAlchemy models
 ModelType = TypeVar("ModelType")
 
+# Count columns stored in every snapshot
+SNAPSHOT_FIELDS = ('realizowane', 'oczekuje', 'combined', 'nie_dodane', 'wykonane')
+
+# Supported aggregation buckets for aggregate_snapshots
+SNAPSHOT_BUCKETS = ('hour', 'day', 'month')
+
+# Dialects with a native INSERT ... ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = ('postgresql', 'sqlite')
+
+# Adam columns written by update_adam_record
+ADAM_FIELDS = ('created_at',) + SNAPSHOT_FIELDS
+
+
+def upsert_statement(dialect: str, model_class, index_elements: Sequence[str],
+                     update_columns: Optional[Iterable[str]] = None):
+    """
+    Build an INSERT ... ON CONFLICT DO UPDATE statement for a model.
+    
+    Args:
+        dialect: Name of the database dialect
+        model_class: The SQLAlchemy model class
+        index_elements: Columns of the unique constraint the conflict is detected on
+        update_columns: Columns overwritten on conflict (default: all other columns)
+        
+    Returns:
+        The statement (execute it with a list of row dicts), or None if the
+        dialect has no native upsert
+    """
+    if dialect not in UPSERT_DIALECTS:
+        return None
+    # Dialect modules are imported on first use only
+    dialect_insert = importlib.import_module(f"sqlalchemy.dialects.{dialect}").insert
+    
+    if update_columns is None:
+        update_columns = [column.name for column in model_class.__table__.columns
+                          if column.name not in index_elements]
+    stmt = dialect_insert(model_class)
+    return stmt.on_conflict_do_update(
+        index_elements=list(index_elements),
+        set_={column: stmt.excluded[column] for column in update_columns}
+    )
+
 
 class DatabaseManager:
     """
@@ -19,9 +66,15 @@ class DatabaseManager:
     Provides methods for CRUD operations, complex queries, and transaction management.
     """
     
+    # Callbacks run with the new Adam record after update_adam_record commits
+    _adam_listeners = []
+    
     def __init__(self):
-        """Initialize the DatabaseManager."""
-        self.session_factory = SessionLocal
+        """Initialize the DatabaseManager. The engine is created on first use."""
+    
+    @property
+    def session_factory(self):
+        return get_session_factory()
     
     @contextmanager
     def get_session(self):
@@ -55,6 +108,52 @@ class DatabaseManager:
                 session.rollback()
                 raise
     
+    @classmethod
+    def add_adam_listener(cls, callback) -> None:
+        """
+        Register a callback run after every committed update_adam_record.
+        
+        Args:
+            callback: Callable receiving the new (detached) Adam record
+        """
+        cls._adam_listeners.append(callback)
+    
+    @classmethod
+    def _notify_adam_listeners(cls, record: Adam) -> None:
+        for callback in cls._adam_listeners:
+            try:
+                callback(record)
+            except Exception as e:
+                logger.exception("Error in Adam record listener")
+    
+    def create_tables(self) -> None:
+        """
+        Create tables that don't exist yet. Existing tables are left untouched,
+        except that columns added later (AdamSnapshot.record_id,
+        OrdersSheetRow.r_id) are added if they are missing.
+        """
+        engine = get_engine()
+        Base.metadata.create_all(bind=engine)
+        # AdamSnapshot tables created before the history was kept per tenant;
+        # their rows all belong to record 1
+        self._add_column(engine, AdamSnapshot, 'record_id', 'BIGINT NOT NULL DEFAULT 1')
+        # Mirrored Orders rows stored without their r_id don't match the
+        # sheet, so the next sync rebuilds them
+        self._add_column(engine, OrdersSheetRow, 'r_id', "VARCHAR NOT NULL DEFAULT ''")
+
+    @staticmethod
+    def _add_column(engine, model_class, column: str, definition: str) -> None:
+        # Add a model column missing from a table created by an older version
+        table = model_class.__tablename__
+        if column in {existing['name'] for existing in inspect(engine).get_columns(table)}:
+            return
+        with engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {definition}'))
+            for index in model_class.__table__.indexes:
+                if column in index.columns:
+                    index.create(connection)
+        logger.info("Added column", extra={"table": table, "column": column})
+    
     def create(self, model_class: Type[ModelType], **kwargs) -> bool:
         """
         Create a new record in the database.
@@ -79,6 +178,7 @@ class DatabaseManager:
 
             return False
     
+    @timed_stage("db_get_by_id")
     def get_by_id(self, model_class: Type[ModelType], record_id: int) -> Optional[ModelType]:
         """
         Retrieve a record by its ID.
@@ -96,10 +196,12 @@ class DatabaseManager:
         except Exception as e:
             return None
 
+    @timed_stage("db_update_adam")
     def update_adam_record(self, output_realizowane: str, output_oczekuje: str, 
-                          output_combined: str, output_nie_dodane: str, output_wykonane: str) -> bool:
+                          output_combined: str, output_nie_dodane: str, output_wykonane: str,
+                          record_id: int = 1, created_at: Optional[datetime] = None) -> bool:
         """
-        Update the Adam record with id=1 with new values and current timestamp.
+        Update an Adam record (id=1 unless given) with new values and their timestamp.
         
         Args:
             output_realizowane: Value for realizowane field
@@ -107,39 +209,514 @@ class DatabaseManager:
             output_combined: Value for combined field
             output_nie_dodane: Value for nie_dodane field
             output_wykonane: Value for wykonane field
+            record_id: Id of the record, one per tenant
+            created_at: When the values were read upstream (aware datetime),
+                now if not given
             
         Returns:
             True if update was successful, False otherwise
         """
+        current_time_utc = created_at or datetime.now(timezone.utc)
+        values = {
+            'created_at': current_time_utc,
+            'realizowane': output_realizowane,
+            'oczekuje': output_oczekuje,
+            'combined': output_combined,
+            'nie_dodane': output_nie_dodane,
+            'wykonane': output_wykonane
+        }
         try:
-            # Get current time in UTC
-            current_time_utc = datetime.now(timezone.utc)
-            
             with self.transaction() as session:
-                # Try to update existing record with id=1
-                updated_rows = session.query(Adam).filter(Adam.id == 1).update({
-                    'created_at': current_time_utc,
-                    'realizowane': output_realizowane,
-                    'oczekuje': output_oczekuje,
-                    'combined': output_combined,
-                    'nie_dodane': output_nie_dodane,
-                    'wykonane': output_wykonane
-                })
-                
-                # If no record was updated, create a new one with id=1
-                if updated_rows == 0:
-                    new_record = Adam(
-                        id=1,
-                        created_at=current_time_utc,
-                        realizowane=output_realizowane,
-                        oczekuje=output_oczekuje,
-                        combined=output_combined,
-                        nie_dodane=output_nie_dodane,
-                        wykonane=output_wykonane
-                    )
-                    session.add(new_record)
+                stmt = upsert_statement(session.get_bind().dialect.name, Adam, ['id'], ADAM_FIELDS)
+                if stmt is not None:
+                    # Single INSERT ... ON CONFLICT DO UPDATE round trip
+                    session.execute(stmt, [self._adam_row(values, record_id)])
+                else:
+                    row = self._adam_row(values, record_id)
+                    updated_rows = session.query(Adam).filter(Adam.id == record_id).update(row)
+                    
+                    # If no record was updated, create a new one with the id
+                    if updated_rows == 0:
+                        session.add(Adam(**row))
                 
+                # Keep the history in the same transaction
+                session.add(self._snapshot(values, record_id))
+        except Exception as e:
+            STAGE_ERRORS.labels(stage="db_update_adam").inc()
+            logger.exception("Error updating Adam record")
+            return False
+        
+        self._notify_adam_listeners(Adam(id=record_id, **values))
+        return True
+
+    @staticmethod
+    def _adam_row(values: dict, record_id: int) -> dict:
+        # Adam.created_at is a naive DateTime holding UTC; asyncpg rejects aware values for it
+        return dict(values, id=record_id, created_at=values['created_at'].replace(tzinfo=None))
+
+    @classmethod
+    def _snapshot(cls, values: dict, record_id: int) -> AdamSnapshot:
+        return AdamSnapshot(record_id=record_id, created_at=values['created_at'], **{
+            field: cls._to_int(values[field]) for field in SNAPSHOT_FIELDS
+        })
+
+    @staticmethod
+    def _to_int(value) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    @timed_stage("db_bulk_upsert")
+    def bulk_upsert(self, model_class: Type[ModelType], rows: List[dict],
+                    index_elements: Sequence[str] = ('id',),
+                    update_columns: Optional[Iterable[str]] = None,
+                    batch_size: int = 1000) -> bool:
+        """
+        Insert rows, or update the existing ones, in batched statements.
+        
+        Uses INSERT ... ON CONFLICT DO UPDATE on PostgreSQL and SQLite and
+        falls back to session.merge (a SELECT per row) on other databases.
+        
+        Args:
+            model_class: The SQLAlchemy model class
+            rows: Dicts of column values; all rows must have the same keys
+            index_elements: Columns of the unique constraint the conflict is detected on
+            update_columns: Columns overwritten on conflict (default: all other columns)
+            batch_size: Rows per statement
+            
+        Returns:
+            True if the upsert was successful, False otherwise
+        """
+        if not rows:
+            return True
+        try:
+            with self.transaction() as session:
+                self._upsert_rows(session, model_class, rows, index_elements, update_columns, batch_size)
+                return True
+        except Exception as e:
+            STAGE_ERRORS.labels(stage="db_bulk_upsert").inc()
+            logger.exception("Error upserting rows", extra={"model": model_class.__name__})
+            return False
+
+    @staticmethod
+    def _upsert_rows(session: Session, model_class, rows: List[dict], index_elements: Sequence[str],
+                     update_columns: Optional[Iterable[str]] = None, batch_size: int = 1000) -> None:
+        if not rows:
+            return
+        if update_columns is None:
+            update_columns = [key for key in rows[0] if key not in index_elements]
+        stmt = upsert_statement(session.get_bind().dialect.name, model_class,
+                                index_elements, update_columns)
+        for i in range(0, len(rows), batch_size):
+            if stmt is not None:
+                session.execute(stmt, rows[i:i + batch_size])
+            else:
+                for row in rows[i:i + batch_size]:
+                    session.merge(model_class(**row))
+
+    @timed_stage("db_apply_order_changes")
+    def apply_order_changes(self, tenant: str, rows: List[dict], removed_ids: Iterable[str] = (),
+                            cursors: Optional[dict] = None, replace: bool = False) -> bool:
+        """
+        Apply a batch of order changes of a tenant to the OrderState table.
+        
+        The changes and the new sync cursors are committed in one transaction,
+        so a failed sync is retried from the previous cursor.
+        
+        Args:
+            tenant: Tenant the orders belong to
+            rows: Dicts with order_id, status, is_iphone and synced_at of the
+                orders to insert or update
+            removed_ids: Ids of orders that no longer have a tracked status
+            cursors: SyncState cursors to set, name -> datetime
+            replace: Delete every stored order of the tenant first (full resync)
+            
+        Returns:
+            True if the changes were applied, False otherwise
+        """
+        removed_ids = list(removed_ids)
+        try:
+            with self.transaction() as session:
+                if replace:
+                    session.query(OrderState).filter(OrderState.tenant == tenant).delete(synchronize_session=False)
+                self._upsert_rows(session, OrderState, [dict(row, tenant=tenant) for row in rows],
+                                  ['tenant', 'order_id'])
+                for i in range(0, len(removed_ids), 1000):
+                    (session.query(OrderState)
+                     .filter(OrderState.tenant == tenant, OrderState.order_id.in_(removed_ids[i:i + 1000]))
+                     .delete(synchronize_session=False))
+                self._upsert_rows(session, SyncState, [
+                    {'name': name, 'cursor': value} for name, value in (cursors or {}).items()
+                ], ['name'])
+                return True
+        except Exception as e:
+            STAGE_ERRORS.labels(stage="db_apply_order_changes").inc()
+            logger.exception("Error applying order changes")
+            return False
+
+    def get_sync_cursor(self, name: str) -> Optional[datetime]:
+        """Return the value of a SyncState cursor, or None if it was never set."""
+        with self.get_session() as session:
+            state = session.get(SyncState, name)
+            if state is None:
+                return None
+            # SQLite returns naive datetimes; cursors are always stored in UTC
+            cursor = state.cursor
+            return cursor if cursor.tzinfo is not None else cursor.replace(tzinfo=timezone.utc)
+
+    @timed_stage("db_count_order_states")
+    def count_order_states(self, statuses: Sequence[str], tenant: str) -> dict:
+        """
+        Count the stored orders of each status, in total and with an iPhone.
+        
+        Args:
+            statuses: Order statuses to count
+            tenant: Tenant the orders belong to
+            
+        Returns:
+            dict: status -> (orders_count, iphone_count), 0 for statuses without orders
+        """
+        with self.get_session() as session:
+            rows = (session.query(OrderState.status, OrderState.is_iphone, func.count())
+                    .filter(OrderState.tenant == tenant, OrderState.status.in_(list(statuses)))
+                    .group_by(OrderState.status, OrderState.is_iphone)
+                    .all())
+        
+        counts = {status: [0, 0] for status in statuses}
+        for status, is_iphone, count in rows:
+            counts[status][0] += count
+            if is_iphone:
+                counts[status][1] += count
+        return {status: tuple(value) for status, value in counts.items()}
+
+    @timed_stage("db_apply_sheet_rows")
+    def apply_sheet_rows(self, model_class, tenant: str, rows: List[dict], row_count: Optional[int] = None,
+                         cursors: Optional[dict] = None, replace: bool = False) -> bool:
+        """
+        Apply changed rows of a mirrored sheet (OrdersSheetRow, M2SheetRow).
+        
+        Args:
+            model_class: The mirror model
+            tenant: Tenant the sheet belongs to
+            rows: Dicts with the row number and column values of new or changed rows
+            row_count: Last row of the sheet; stored rows below it are deleted
+            cursors: SyncState cursors to set, name -> datetime
+            replace: Delete every stored row of the tenant first (full resync)
+            
+        Returns:
+            True if the rows were applied, False otherwise
+        """
+        try:
+            with self.transaction() as session:
+                stored = session.query(model_class).filter(model_class.tenant == tenant)
+                if replace:
+                    stored.delete(synchronize_session=False)
+                elif row_count is not None:
+                    stored.filter(model_class.row > row_count).delete(synchronize_session=False)
+                self._upsert_rows(session, model_class, [dict(row, tenant=tenant) for row in rows],
+                                  ['tenant', 'row'])
+                self._upsert_rows(session, SyncState, [
+                    {'name': name, 'cursor': value} for name, value in (cursors or {}).items()
+                ], ['name'])
                 return True
         except Exception as e:
-            logging.error(f"Error updating Adam record: {e}")
-            return False
\ No newline at end of file
+            STAGE_ERRORS.labels(stage="db_apply_sheet_rows").inc()
+            logger.exception("Error applying sheet rows", extra={"model": model_class.__name__})
+            return False
+
+    def get_orders_sheet_rows(self, tenant: str) -> dict:
+        """Return row -> (r_state, r_item_name, r_id) of the mirrored Orders sheet of a tenant."""
+        with self.get_session() as session:
+            return {row: (r_state, r_item_name, r_id) for row, r_state, r_item_name, r_id in
+                    session.query(OrdersSheetRow.row, OrdersSheetRow.r_state, OrdersSheetRow.r_item_name,
+                                  OrdersSheetRow.r_id)
+                    .filter(OrdersSheetRow.tenant == tenant)}
+
+    @timed_stage("db_count_orders_sheet")
+    def count_orders_sheet_items(self, tenant: str, r_state: str) -> dict:
+        """
+        Count the mirrored Orders rows with a state, per item name.
+        
+        Returns:
+            dict: r_item_name -> number of rows
+        """
+        with self.get_session() as session:
+            return dict(session.query(OrdersSheetRow.r_item_name, func.count())
+                        .filter(OrdersSheetRow.tenant == tenant, OrdersSheetRow.r_state == r_state)
+                        .group_by(OrdersSheetRow.r_item_name))
+
+    def get_m2_last_row(self, tenant: str) -> Optional[M2SheetRow]:
+        """Return the last mirrored M2 row of a tenant, None if nothing is mirrored."""
+        with self.get_session() as session:
+            return (session.query(M2SheetRow).filter(M2SheetRow.tenant == tenant)
+                    .order_by(M2SheetRow.row.desc()).first())
+
+    def get_m2_last_serial(self, tenant: str) -> Optional[str]:
+        """Return the last non-empty mirrored M2 serial number of a tenant."""
+        with self.get_session() as session:
+            return (session.query(M2SheetRow.serial)
+                    .filter(M2SheetRow.tenant == tenant, M2SheetRow.serial != "")
+                    .order_by(M2SheetRow.row.desc()).limit(1).scalar())
+
+    @timed_stage("db_count_m2")
+    def count_m2_since(self, tenant: str, serial: str) -> Optional[int]:
+        """
+        Count the non-empty mirrored M2 serial numbers below the last row holding serial.
+        
+        Returns:
+            int: Number of serial numbers added after it, None if serial is not in the mirror
+        """
+        with self.get_session() as session:
+            position = (session.query(func.max(M2SheetRow.row))
+                        .filter(M2SheetRow.tenant == tenant, M2SheetRow.serial == serial).scalar())
+            if position is None:
+                return None
+            return (session.query(func.count())
+                    .filter(M2SheetRow.tenant == tenant, M2SheetRow.row > position, M2SheetRow.serial != "")
+                    .scalar())
+
+    @timed_stage("db_count_m2_per_day")
+    def count_m2_per_day(self, tenant: str, start: date, end: date) -> tuple:
+        """
+        Count the non-empty mirrored M2 serial numbers per day in [start, end].
+        
+        Returns:
+            tuple: (dict day -> count, number of rows with a valid date,
+                number of rows without one)
+        """
+        with self.get_session() as session:
+            rows = (session.query(M2SheetRow.day, func.count())
+                    .filter(M2SheetRow.tenant == tenant, M2SheetRow.serial != "",
+                            M2SheetRow.day >= start, M2SheetRow.day <= end)
+                    .group_by(M2SheetRow.day)
+                    .all())
+            total, dated = (session.query(func.count(), func.count(M2SheetRow.day))
+                            .filter(M2SheetRow.tenant == tenant, M2SheetRow.serial != "")
+                            .one())
+        return dict(rows), dated, total - dated
+
+    @timed_stage("db_get_snapshots")
+    def get_snapshots(self, start: datetime, end: datetime, record_id: int = 1,
+                      limit: int = 10000) -> List[AdamSnapshot]:
+        """
+        Retrieve snapshots of a record with start <= created_at < end, oldest first.
+        
+        Args:
+            start: Beginning of the range (inclusive)
+            end: End of the range (exclusive)
+            record_id: Adam record (tenant) the snapshots belong to
+            limit: Maximum number of snapshots returned
+            
+        Returns:
+            List of snapshots
+        """
+        with self.get_session() as session:
+            return (session.query(AdamSnapshot)
+                    .filter(AdamSnapshot.record_id == record_id,
+                            AdamSnapshot.created_at >= start, AdamSnapshot.created_at < end)
+                    .order_by(AdamSnapshot.created_at)
+                    .limit(limit)
+                    .all())
+
+    @timed_stage("db_aggregate_snapshots")
+    def aggregate_snapshots(self, start: datetime, end: datetime, bucket: str, record_id: int = 1) -> List[dict]:
+        """
+        Aggregate the snapshots of a record per hour, day or month (Warsaw
+        time on PostgreSQL, stored UTC time on SQLite).
+        
+        Args:
+            start: Beginning of the range (inclusive)
+            end: End of the range (exclusive)
+            bucket: One of SNAPSHOT_BUCKETS
+            record_id: Adam record (tenant) the snapshots belong to
+            
+        Returns:
+            One dict per bucket with the number of samples and avg/min/max of every count
+        """
+        if bucket not in SNAPSHOT_BUCKETS:
+            raise ValueError(f"Unsupported bucket {bucket}, expected one of {SNAPSHOT_BUCKETS}")
+        
+        with self.get_session() as session:
+            dialect = session.get_bind().dialect.name
+            if dialect == 'postgresql':
+                bucket_column = func.date_trunc(bucket, func.timezone('Europe/Warsaw', AdamSnapshot.created_at))
+            elif dialect == 'sqlite':
+                formats = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'month': '%Y-%m'}
+                bucket_column = func.strftime(formats[bucket], AdamSnapshot.created_at)
+            else:
+                raise ValueError(f"Snapshot aggregation is not supported on {dialect}")
+            
+            columns = [bucket_column.label('bucket'), func.count().label('samples')]
+            for field in SNAPSHOT_FIELDS:
+                column = getattr(AdamSnapshot, field)
+                columns += [func.avg(column), func.min(column), func.max(column)]
+            
+            rows = (session.query(*columns)
+                    .filter(AdamSnapshot.record_id == record_id,
+                            AdamSnapshot.created_at >= start, AdamSnapshot.created_at < end)
+                    .group_by(literal_column('bucket'))
+                    .order_by(literal_column('bucket'))
+                    .all())
+        
+        result = []
+        for row in rows:
+            bucket_value = row[0].isoformat() if isinstance(row[0], datetime) else row[0]
+            item = {'bucket': bucket_value, 'samples': row[1]}
+            for index, field in enumerate(SNAPSHOT_FIELDS):
+                avg, low, high = row[2 + index * 3: 5 + index * 3]
+                item[field] = {
+                    'avg': round(float(avg), 2) if avg is not None else None,
+                    'min': low,
+                    'max': high
+                }
+            result.append(item)
+        return result
+
+    @timed_stage("db_prune_snapshots")
+    def prune_snapshots(self, raw_days: int, retention_days: int, record_id: int = 1) -> int:
+        """
+        Apply the snapshot retention policy to the snapshots of a record.
+        
+        Snapshots older than raw_days are downsampled to the last one of every
+        hour, and snapshots older than retention_days are deleted.
+        
+        Args:
+            raw_days: Days for which every snapshot is kept
+            retention_days: Days after which snapshots are deleted
+            record_id: Adam record (tenant) the snapshots belong to
+            
+        Returns:
+            Number of deleted snapshots
+        """
+        now = datetime.now(timezone.utc)
+        
+        with self.transaction() as session:
+            deleted = (session.query(AdamSnapshot)
+                       .filter(AdamSnapshot.record_id == record_id,
+                               AdamSnapshot.created_at < now - timedelta(days=retention_days))
+                       .delete(synchronize_session=False))
+            
+            rows = (session.query(AdamSnapshot.id, AdamSnapshot.created_at)
+                    .filter(AdamSnapshot.record_id == record_id,
+                            AdamSnapshot.created_at < now - timedelta(days=raw_days))
+                    .order_by(AdamSnapshot.created_at, AdamSnapshot.id)
+                    .all())
+            
+            # Keep the last snapshot of every hour
+            last_in_hour = {}
+            for snapshot_id, created_at in rows:
+                last_in_hour[created_at.replace(minute=0, second=0, microsecond=0)] = snapshot_id
+            keep = set(last_in_hour.values())
+            drop = [snapshot_id for snapshot_id, _ in rows if snapshot_id not in keep]
+            
+            for i in range(0, len(drop), 1000):
+                session.query(AdamSnapshot).filter(AdamSnapshot.id.in_(drop[i:i + 1000])).delete(synchronize_session=False)
+            
+            return deleted + len(drop)
+
+
+class AsyncDatabaseManager:
+    """
+    asyncio variant of DatabaseManager for async routes.
+    
+    Offers the same session, transaction, get_by_id and update_adam_record
+    surface on top of the async engine, and notifies the same Adam listeners.
+    """
+    
+    def __init__(self):
+        """Initialize the AsyncDatabaseManager. The engine is created on first use."""
+    
+    @property
+    def session_factory(self):
+        return get_async_session_factory()
+    
+    @asynccontextmanager
+    async def get_session(self):
+        """
+        Async context manager for database sessions.
+        Ensures proper session cleanup and error handling.
+        """
+        session = self.session_factory()
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Async context manager for database transactions.
+        Automatically commits on success or rolls back on error.
+        """
+        async with self.get_session() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+    
+    @timed_stage("db_get_by_id")
+    async def get_by_id(self, model_class: Type[ModelType], record_id: int) -> Optional[ModelType]:
+        """
+        Retrieve a record by its ID.
+        
+        Args:
+            model_class: The SQLAlchemy model class
+            record_id: The ID of the record to retrieve
+            
+        Returns:
+            The model instance or None if not found
+        """
+        try:
+            async with self.get_session() as session:
+                return await session.get(model_class, record_id)
+        except Exception as e:
+            return None
+    
+    @timed_stage("db_update_adam")
+    async def update_adam_record(self, output_realizowane: str, output_oczekuje: str,
+                                 output_combined: str, output_nie_dodane: str, output_wykonane: str,
+                                 record_id: int = 1, created_at: Optional[datetime] = None) -> bool:
+        """
+        Update an Adam record (id=1 unless given) with new values and their
+        timestamp, and append a snapshot. See DatabaseManager.update_adam_record.
+        
+        Returns:
+            True if update was successful, False otherwise
+        """
+        current_time_utc = created_at or datetime.now(timezone.utc)
+        values = {
+            'created_at': current_time_utc,
+            'realizowane': output_realizowane,
+            'oczekuje': output_oczekuje,
+            'combined': output_combined,
+            'nie_dodane': output_nie_dodane,
+            'wykonane': output_wykonane
+        }
+        try:
+            async with self.transaction() as session:
+                stmt = upsert_statement(session.get_bind().dialect.name, Adam, ['id'], ADAM_FIELDS)
+                if stmt is not None:
+                    await session.execute(stmt, [DatabaseManager._adam_row(values, record_id)])
+                else:
+                    row = DatabaseManager._adam_row(values, record_id)
+                    result = await session.execute(update(Adam).where(Adam.id == record_id).values(**row))
+                    
+                    # If no record was updated, create a new one with the id
+                    if result.rowcount == 0:
+                        session.add(Adam(**row))
+                
+                # Keep the history in the same transaction
+                session.add(DatabaseManager._snapshot(values, record_id))
+        except Exception as e:
+            STAGE_ERRORS.labels(stage="db_update_adam").inc()
+            logger.exception("Error updating Adam record")
+            return False
+        
+        DatabaseManager._notify_adam_listeners(Adam(id=record_id, **values))
+        return True
@@ -0,0 +1,1223 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import zoneinfo
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta, timezone
+from itertools import zip_longest
+
+import gspread
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+
+from DatabaseManager import DatabaseManager
+from cache import TTLCache
+from classifier import IPHONE, get_classifier
+from idosell import AsyncIdoSellClient, IdoSellClient, IdoSellError
+from metrics import timed, timed_stage
+from models import M2SheetRow, OrdersSheetRow
+from sheets import SheetsGateway, SheetWriteBatch
+from tenants import DEFAULT_TENANT
+
+logger = logging.getLogger(__name__)
+
+# Szukajka sheet layout: one column per month (B=Jan, C=Feb, ..., M=Dec),
+# one row per day (row 1 is header, so day 1 = row 2, day 31 = row 32)
+MONTH_COLUMNS = {
+    1: 'B',   # January
+    2: 'C',   # February
+    3: 'D',   # March
+    4: 'E',   # April
+    5: 'F',   # May
+    6: 'G',   # June
+    7: 'H',   # July
+    8: 'I',   # August
+    9: 'J',   # September
+    10: 'K',  # October
+    11: 'L',  # November
+    12: 'M'   # December
+}
+
+# Order statuses counted on the dashboard (realizowane, oczekuje)
+TRACKED_ORDER_STATUSES = ("on_order", "wait_for_dispatch")
+
+# SyncState cursors of the order-state sync
+ORDER_SYNC_CURSOR = "idosell_orders_modified"
+ORDER_FULL_SYNC_CURSOR = "idosell_orders_full"
+
+# SyncState cursor with the time of the last full resync of the Orders sheet mirror
+ORDERS_MIRROR_FULL_CURSOR = "orders_sheet_full"
+
+# Orders column with a unique value per row, used to notice rows that moved
+ORDERS_ID_COLUMN = "r_id"
+
+# IdoSell takes and returns dates in the shop's local time
+IDOSELL_TZ = zoneinfo.ZoneInfo("Europe/Warsaw")
+
+# Date formats accepted in the M2 date column
+M2_DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+                   "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y")
+
+
+def parse_m2_date(value):
+    """Parse a date from the M2 date column, returns None if it can't be parsed."""
+    value = str(value).strip()
+    for date_format in M2_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+class OrderCounter:
+    """
+    Streaming counter of all and iPhone orders.
+    
+    Orders are classified as they are added and then discarded, so memory
+    does not grow with the number of orders.
+    """
+    
+    def __init__(self, orders_count=0, iphone_count=0):
+        self.orders_count = orders_count
+        self.iphone_count = iphone_count
+
+    @staticmethod
+    def is_iphone_order(order):
+        """Return True if any product of the order is an iPhone."""
+        return get_classifier().order_has(IPHONE, order)
+
+    def add(self, order):
+        self.orders_count += 1
+        if self.is_iphone_order(order):
+            self.iphone_count += 1  # Count each order only once
+
+    def __add__(self, other):
+        return OrderCounter(self.orders_count + other.orders_count,
+                            self.iphone_count + other.iphone_count)
+
+    def as_dict(self):
+        return {
+            "orders_count": self.orders_count,
+            "iphone_count": self.iphone_count,
+            "non_iphone_count": self.orders_count - self.iphone_count,
+        }
+
+
+class Adam:
+    def __init__(self, client=None, tenant=None, sheets=None):
+        """
+        Initialize the IdoSell API client with credentials.
+        
+        Args:
+            client: Optional gspread client to use instead of authorizing with
+                the service account credentials (e.g. shared between tenants)
+            tenant: Optional Tenant whose sheets and IdoSell shop are used;
+                settings it leaves unset come from the environment
+            sheets: Optional SheetsGateway to share the Sheets request budget
+        """
+        self.tenant = tenant.name if tenant is not None else DEFAULT_TENANT
+        
+        # First try to get API key from the tenant or an environment variable
+        self.ids_key = (tenant and tenant.idosell_api_key) or os.environ.get("IDOSELL_API_KEY")
+        
+        # If not found in environment variable, try to get from tokens file
+        if not self.ids_key:
+            try:
+                with open("/home/vis/Projects/refurbed/keys/tokens.json", "r") as f:
+                    tokens = json.load(f)
+                    self.ids_key = tokens.get("idosell_api_key")
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                # Handle any errors loading from file
+                pass
+        
+        if not self.ids_key:
+            raise ValueError("IdoSell API key must be provided as IDOSELL_API_KEY environment variable or in tokens.json file")
+        
+        # === Google Sheets Setup ===
+        if client is not None:
+            self.creds = None
+            self.client = client
+        else:
+            self.creds = self._load_credentials()
+            # gspread wraps the credentials in an AuthorizedSession, which refreshes
+            # the access token transparently whenever it expires
+            self.client = gspread.authorize(self.creds)
+
+        # Timeout (seconds) applied to every upstream call
+        self.call_timeout = float(os.environ.get("ADAM_CALL_TIMEOUT", "20"))
+        self.client.set_timeout(self.call_timeout)
+
+        # Issue the independent upstream calls of /search_orders concurrently
+        self.concurrent_fetch = os.environ.get("ADAM_CONCURRENT_FETCH", "true").lower() == "true"
+        self._executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix="adam-fetch")
+
+
+        self.orders_sheet_id = (tenant and tenant.orders_sheet_id) or os.environ.get("REFURBED_PLIK")
+        if not self.orders_sheet_id:
+            self.orders_sheet_id = "15e6oc33_A21dNNv03wqdixYc9_mM2GTQzum9z2HylEg"
+            
+        self.plikM2 = (tenant and tenant.m2_sheet_id) or os.environ.get("M2_M47_PLIK")
+        if not self.plikM2:
+            raise ValueError("M2_M47_PLIK must be provided as environment variable")
+
+        # Cache in front of the upstream reads. Each source has its own TTL and
+        # values are served stale (while refreshing) for CACHE_STALE_TTL seconds
+        self.cache = TTLCache(stale_ttl=float(os.environ.get("CACHE_STALE_TTL", "600")))
+        self.cache_ttl = {
+            "orders": float(os.environ.get("CACHE_TTL_ORDERS", "60")),
+            "count_new": float(os.environ.get("CACHE_TTL_ORDERS_SHEET", "60")),
+            "m2": float(os.environ.get("CACHE_TTL_M2", "60")),
+            "last_sn": float(os.environ.get("CACHE_TTL_CONFIG", "300")),
+        }
+
+        # Read only the needed Orders columns in count_new, header resolved once
+        self.projected_orders_read = os.environ.get("ADAM_PROJECTED_ORDERS_READ", "true").lower() == "true"
+        self._orders_columns = {}
+
+        # Every Sheets call goes through the gateway: per-spreadsheet request
+        # budget, coalescing of identical reads, retries on 429/5xx
+        self.sheets = sheets or SheetsGateway(
+            requests_per_minute=int(os.environ.get("SHEETS_QUOTA_PER_MINUTE", "60")),
+            retries=int(os.environ.get("SHEETS_RETRIES", "4")),
+            max_wait=self.call_timeout,
+        )
+
+        # Incremental copy of column C of the M2 sheet, see sync_m2
+        # Reentrant: count_since_and_last holds it across count_since
+        self._m2_lock = threading.RLock()
+        self._reset_m2()
+
+        # Spreadsheet and worksheet handles are opened on first use and reused
+        self._spreadsheets = {}
+        self._worksheets = {}
+        self._handles_lock = threading.Lock()
+
+        # Base URL for API requests
+        self.base_url = ((tenant and tenant.idosell_base_url)
+                         or os.environ.get("IDOSELL_API_BASE_URL", "https://vedion.pl/api/admin/v5"))
+        
+        # Pooled, retrying IdoSell client with a circuit breaker
+        self.idosell = IdoSellClient(
+            self.base_url,
+            self.ids_key,
+            connect_timeout=float(os.environ.get("IDOSELL_CONNECT_TIMEOUT", "5")),
+            read_timeout=self.call_timeout,
+            retries=int(os.environ.get("IDOSELL_RETRIES", "3")),
+            backoff_factor=float(os.environ.get("IDOSELL_BACKOFF", "0.5")),
+            failure_threshold=int(os.environ.get("IDOSELL_BREAKER_THRESHOLD", "5")),
+            cooldown=float(os.environ.get("IDOSELL_BREAKER_COOLDOWN", "60")),
+        )
+        # Same settings for async routes, sharing the circuit breaker state
+        self.idosell_async = AsyncIdoSellClient(
+            self.base_url,
+            self.ids_key,
+            connect_timeout=float(os.environ.get("IDOSELL_CONNECT_TIMEOUT", "5")),
+            read_timeout=self.call_timeout,
+            retries=int(os.environ.get("IDOSELL_RETRIES", "3")),
+            backoff_factor=float(os.environ.get("IDOSELL_BACKOFF", "0.5")),
+            breaker=self.idosell.breaker,
+        )
+
+        # Column of the M2 "Dane" sheet holding the date of each serial number
+        self.m2_date_column = os.environ.get("M2_DATE_COLUMN", "A")
+
+        # Orders per results page of the IdoSell search (API maximum is 100)
+        self.page_size = int(os.environ.get("IDOSELL_PAGE_SIZE", "100"))
+
+        # Optional local order-state table, see sync_order_state. When enabled
+        # the order counts come from an indexed query and each refresh only
+        # fetches the orders modified since the previous one
+        self.order_state_sync = os.environ.get("ORDER_STATE_SYNC", "false").lower() == "true"
+        self.order_sync_overlap = timedelta(seconds=float(os.environ.get("ORDER_SYNC_OVERLAP", "120")))
+        self.order_full_resync = timedelta(hours=float(os.environ.get("ORDER_FULL_RESYNC_HOURS", "24")))
+        self.db = DatabaseManager()
+
+        # Optional local mirror of the Orders and M2 sheets, see
+        # _sync_orders_mirror and _sync_m2_mirror. When enabled count_new,
+        # show_count and backfill are indexed queries and Sheets is only read
+        # for the delta sync
+        self.sheet_mirror = os.environ.get("SHEET_MIRROR", "false").lower() == "true"
+        self.sheet_mirror_full_resync = timedelta(hours=float(os.environ.get("SHEET_MIRROR_FULL_RESYNC_HOURS", "24")))
+        self.sheet_mirror_max_ranges = int(os.environ.get("SHEET_MIRROR_MAX_RANGES", "50"))
+        self._orders_mirror_lock = threading.Lock()
+        self._orders_mirror_rows = None
+
+    @timed_stage("sheets_auth")
+    def _load_credentials(self):
+        """Load the Google service account credentials."""
+        scope = [
+            "https://spreadsheets.google.com/feeds",
+            "https://www.googleapis.com/auth/drive"
+        ]
+        
+        # Try to get credentials from environment variable
+        creds_json = os.environ.get("GCLOUD_CREDENTIALS_JSON")
+        
+        if creds_json:
+            # Use credentials from environment variable
+            return service_account.Credentials.from_service_account_info(json.loads(creds_json), scopes=scope)
+        else:
+            # Fallback to loading from file
+            credentials_file_path = "/home/vis/Projects/Adam/keys/ref-ids-6c3ebadcd9f8.json"
+            try:
+                return service_account.Credentials.from_service_account_file(credentials_file_path, scopes=scope)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"Google credentials not found in environment variable or at {credentials_file_path}")
+
+    def _worksheet(self, spreadsheet_id, title):
+        """
+        Return a cached worksheet handle, opening the spreadsheet only once.
+        
+        Args:
+            spreadsheet_id: Key of the Google spreadsheet
+            title: Name of the worksheet tab
+            
+        Returns:
+            gspread.Worksheet: Reusable worksheet handle
+        """
+        key = (spreadsheet_id, title)
+        worksheet = self._worksheets.get(key)
+        if worksheet is not None:
+            return worksheet
+
+        with self._handles_lock:
+            if key not in self._worksheets:
+                spreadsheet = self._spreadsheets.get(spreadsheet_id)
+                with timed("sheets_open", worksheet=title):
+                    if spreadsheet is None:
+                        spreadsheet = self.sheets.call(spreadsheet_id, self.client.open_by_key, spreadsheet_id)
+                        self._spreadsheets[spreadsheet_id] = spreadsheet
+                    self._worksheets[key] = self.sheets.call(spreadsheet_id, spreadsheet.worksheet, title)
+            return self._worksheets[key]
+
+    @property
+    def orders_sheet(self):
+        return self._worksheet(self.orders_sheet_id, "Orders")
+
+    @property
+    def config_sheet(self):
+        return self._worksheet(self.orders_sheet_id, "Config")
+
+    @property
+    def output_sheet(self):
+        return self._worksheet(self.orders_sheet_id, "Szukajka")
+
+    @property
+    def m2_sheet(self):
+        return self._worksheet(self.plikM2, "Dane")
+
+    def warm_up(self):
+        """
+        Fetch an access token and open the worksheets used by /search_orders,
+        so the first request only pays for the actual data calls.
+        """
+        if self.creds is not None and not self.creds.valid:
+            self.creds.refresh(Request())
+        self.orders_sheet
+        self.config_sheet
+        self.m2_sheet
+        
+    def count_new(self, fresh=False):
+        """
+        Count rows from the Orders sheet where r_state is 'NEW' and r_item_name is not an iPhone.
+        
+        Args:
+            fresh: Bypass the cache
+            
+        Returns:
+            int: Number of rows matching the criteria
+        """
+        try:
+            if self.sheet_mirror:
+                loader = self._count_new_from_mirror
+            elif self.projected_orders_read:
+                loader = self._count_new_projected
+            else:
+                loader = self._count_new_records
+            return self.cache.get("count_new", loader, self.cache_ttl["count_new"],
+                                  fresh=fresh, fallback_on_error=True)
+            
+        except Exception as e:
+            # Don't report 0 when the sheet couldn't be read
+            logger.error("Error counting new non-iPhone orders", extra={"error": str(e)})
+            raise
+
+    @timed_stage("orders_sheet_read")
+    def _count_new_records(self):
+        """Count NEW non-iPhone orders from get_all_records (every column of every row)."""
+        # Get all data from the Orders sheet
+        all_data = self.sheets.call(self.orders_sheet_id, self.orders_sheet.get_all_records,
+                                    coalesce_key="orders_records")
+        
+        # NEW rows that have an item name
+        item_names = [row['r_item_name'] for row in all_data
+                      if row.get('r_state') == 'NEW' and 'r_item_name' in row]
+        
+        # Classify the names in one batch and count the non-iPhones
+        return sum(1 for categories in get_classifier().classify_names(item_names) if IPHONE not in categories)
+
+    def _resolve_orders_columns(self):
+        """Map the Orders header names to column letters."""
+        header = self.sheets.call(self.orders_sheet_id, self.orders_sheet.row_values, 1,
+                                  coalesce_key="orders_header")
+        self._orders_columns = {
+            name: gspread.utils.rowcol_to_a1(1, index).rstrip("0123456789")
+            for index, name in enumerate(header, start=1)
+        }
+
+    @timed_stage("orders_sheet_read")
+    def _count_new_projected(self, retry=True):
+        """
+        Count NEW non-iPhone orders reading only the r_state and r_item_name
+        columns with a single batch_get.
+        
+        The header is resolved once and cached. The fetched ranges start at
+        the header row, so a moved column is detected and the header is
+        resolved again.
+        """
+        if not self._orders_columns:
+            self._resolve_orders_columns()
+        
+        names = ('r_state', 'r_item_name')
+        if not all(name in self._orders_columns for name in names):
+            raise ValueError(f"Orders sheet is missing one of the columns {names}")
+        
+        ranges = [f"{self._orders_columns[name]}1:{self._orders_columns[name]}" for name in names]
+        value_ranges = self.sheets.call(self.orders_sheet_id, self.orders_sheet.batch_get, ranges,
+                                        major_dimension=gspread.utils.Dimension.cols,
+                                        coalesce_key=("orders_columns",) + tuple(ranges))
+        state_column, name_column = [value_range[0] if value_range else [] for value_range in value_ranges]
+        
+        if state_column[:1] != ['r_state'] or name_column[:1] != ['r_item_name']:
+            self._orders_columns = {}
+            if retry:
+                return self._count_new_projected(retry=False)
+            raise ValueError("Orders sheet header changed while reading")
+        
+        # Single pass over the two column arrays (header row skipped), then
+        # one batch classification of the NEW rows' item names
+        item_names = [
+            item_name for state, item_name in zip_longest(state_column[1:], name_column[1:], fillvalue="")
+            if state == 'NEW'
+        ]
+        return sum(1 for categories in get_classifier().classify_names(item_names) if IPHONE not in categories)
+
+    def _count_new_from_mirror(self):
+        """Count NEW non-iPhone orders in the local Orders mirror, after a delta sync."""
+        self._sync_orders_mirror()
+        item_counts = self.db.count_orders_sheet_items(self.tenant, 'NEW')
+        name_categories = get_classifier().classify_names(item_counts)
+        return sum(count for categories, count in zip(name_categories, item_counts.values())
+                   if IPHONE not in categories)
+
+    @timed_stage("orders_mirror_sync")
+    def _sync_orders_mirror(self):
+        """
+        Bring the local copy of the Orders r_state and r_item_name columns up to date.
+        
+        States change in place, so the r_state column is read in full and
+        compared with the mirror, together with the r_id column, which tells
+        whether the rows still line up: rows inserted, deleted or sorted
+        above the end of the sheet shift the item names of rows whose state
+        may look unchanged, so if an id moved the mirror is rebuilt.
+        Otherwise r_item_name is only read for the new rows and the rows
+        whose state changed, as one batch_get of contiguous ranges (the
+        whole column if there are more than SHEET_MIRROR_MAX_RANGES of them).
+        Without an r_id column r_item_name is read in full and compared as
+        well. Every SHEET_MIRROR_FULL_RESYNC_HOURS the mirror is rebuilt,
+        which also picks up item names edited without a state change.
+        """
+        with self._orders_mirror_lock:
+            now = datetime.now(timezone.utc)
+            full_cursor = f"{self.tenant}:{ORDERS_MIRROR_FULL_CURSOR}"
+            last_full = self.db.get_sync_cursor(full_cursor)
+            full = last_full is None or now - last_full >= self.sheet_mirror_full_resync
+            if not full and self._orders_mirror_rows is None:
+                self._orders_mirror_rows = self.db.get_orders_sheet_rows(self.tenant)
+            
+            name_letter, columns = self._read_orders_mirror_columns(full)
+            if not full and self._orders_rows_moved(columns):
+                logger.warning("Orders sheet rows moved, rebuilding the mirror", extra={"tenant": self.tenant})
+                full = True
+                name_letter, columns = self._read_orders_mirror_columns(full)
+            
+            # Sheet row of states[i] is i + 2 (row 1 is the header)
+            states = columns['r_state'][1:]
+            row_count = len(states) + 1
+            if full or ORDERS_ID_COLUMN not in columns:
+                item_names = dict(enumerate(columns['r_item_name'][1:], start=2))
+            if full:
+                changed = range(2, row_count + 1)
+            elif ORDERS_ID_COLUMN in columns:
+                changed = [row for row, state in enumerate(states, start=2)
+                           if self._orders_mirror_rows.get(row, (None,))[0] != state]
+                item_names = self._read_orders_item_names(name_letter, changed, row_count)
+            else:
+                changed = [row for row, state in enumerate(states, start=2)
+                           if self._orders_mirror_rows.get(row, (None, None))[:2] != (state, item_names.get(row, ""))]
+            row_ids = dict(enumerate(columns.get(ORDERS_ID_COLUMN, [])[1:], start=2))
+            
+            rows = [{'row': row, 'r_state': states[row - 2], 'r_item_name': item_names.get(row, ""),
+                     'r_id': row_ids.get(row, "")}
+                    for row in changed]
+            if not self.db.apply_sheet_rows(OrdersSheetRow, self.tenant, rows, row_count=row_count,
+                                            cursors={full_cursor: now} if full else None, replace=full):
+                raise RuntimeError("Failed to store the Orders sheet mirror")
+            
+            if full:
+                self._orders_mirror_rows = {}
+            else:
+                for row in [row for row in self._orders_mirror_rows if row > row_count]:
+                    del self._orders_mirror_rows[row]
+            self._orders_mirror_rows.update(
+                (row['row'], (row['r_state'], row['r_item_name'], row['r_id'])) for row in rows)
+            logger.info("Orders sheet mirror synced", extra={
+                "tenant": self.tenant, "full": full, "rows": row_count - 1, "changed": len(rows)
+            })
+
+    def _orders_rows_moved(self, columns):
+        # True if the r_id of a mirrored row is not the one on that row of the sheet
+        if ORDERS_ID_COLUMN not in columns:
+            return False
+        mirrored = self._orders_mirror_rows
+        return any(mirrored[row][2] != row_id
+                   for row, row_id in enumerate(columns[ORDERS_ID_COLUMN][1:], start=2) if row in mirrored)
+
+    def _read_orders_mirror_columns(self, full, retry=True):
+        """
+        Read the r_state and r_id columns, and r_item_name in full or just
+        its header (always in full if the sheet has no r_id column).
+        
+        As in _count_new_projected, the ranges start at the header row, so a
+        moved column is detected and the header is resolved again.
+        
+        Returns:
+            tuple: (r_item_name column letter, dict of column name -> values)
+        """
+        if not self._orders_columns:
+            self._resolve_orders_columns()
+        names = ('r_state', 'r_item_name')
+        if not all(name in self._orders_columns for name in names):
+            raise ValueError(f"Orders sheet is missing one of the columns {names}")
+        if ORDERS_ID_COLUMN in self._orders_columns:
+            names += (ORDERS_ID_COLUMN,)
+        else:
+            full = True
+        
+        ranges = []
+        for name in names:
+            letter = self._orders_columns[name]
+            ranges.append(f"{letter}1" if name == 'r_item_name' and not full else f"{letter}1:{letter}")
+        columns = dict(zip(names, self._read_orders_columns(ranges)))
+        if any(columns[name][:1] != [name] for name in names):
+            self._orders_columns = {}
+            if retry:
+                return self._read_orders_mirror_columns(full, retry=False)
+            raise ValueError("Orders sheet header changed while reading")
+        return self._orders_columns['r_item_name'], columns
+
+    def _read_orders_columns(self, ranges):
+        value_ranges = self.sheets.call(self.orders_sheet_id, self.orders_sheet.batch_get, ranges,
+                                        major_dimension=gspread.utils.Dimension.cols)
+        return [value_range[0] if value_range else [] for value_range in value_ranges]
+
+    def _read_orders_item_names(self, name_letter, rows, row_count):
+        """
+        Read r_item_name for the given (ascending) rows.
+        
+        Returns:
+            dict: row -> item name
+        """
+        runs = []
+        for row in rows:
+            if runs and row == runs[-1][1] + 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+        if not runs:
+            return {}
+        if len(runs) > self.sheet_mirror_max_ranges:
+            runs = [[2, row_count]]
+        
+        columns = self._read_orders_columns([f"{name_letter}{first}:{name_letter}{last}" for first, last in runs])
+        item_names = {}
+        for (first, _), column in zip(runs, columns):
+            item_names.update(enumerate(column, start=first))
+        return item_names
+
+    def sync_m2(self, fresh=False):
+        """
+        Sync the local copy of M2 column C, at most once per CACHE_TTL_M2.
+        
+        Args:
+            fresh: Sync even if the copy is within its TTL
+        """
+        loader = self._sync_m2_mirror if self.sheet_mirror else self._sync_m2
+        self.cache.get("m2", loader, self.cache_ttl["m2"], fresh=fresh, fallback_on_error=True)
+
+    @timed_stage("m2_read")
+    def _sync_m2(self):
+        """
+        Bring the local copy of column C of the M2 sheet up to date.
+        
+        Only rows below the last seen row are fetched (range C{n}:C), and each
+        new serial number is added to a hash index, so the cost of a sync is
+        proportional to the rows added since the previous one. The last seen
+        row is fetched again as a check: if it changed (rows were deleted or
+        rewritten), the copy is rebuilt from scratch.
+        """
+        with self._m2_lock:
+            start_row = max(self._m2_next_row - 1, 1)
+            rows = self.sheets.call(self.plikM2, self.m2_sheet.get, f"C{start_row}:C")
+            
+            if self._m2_next_row > 1:
+                first_cell = rows[0][0] if rows and rows[0] else ""
+                if first_cell != self._m2_last_cell:
+                    logger.warning("M2 sheet changed above the last seen row, re-reading column C")
+                    self._reset_m2()
+                    rows = self.sheets.call(self.plikM2, self.m2_sheet.get, "C1:C")
+                    start_row = 1
+                else:
+                    rows = rows[1:]
+                    
+            for offset, row in enumerate(rows):
+                value = row[0] if row else ""
+                # Filter out empty values (handle different data types)
+                if value is not None and str(value).strip():
+                    self._m2_index[str(value)] = len(self._m2_values)
+                    self._m2_values.append(value)
+                self._m2_last_cell = value
+                self._m2_next_row = start_row + offset + 1
+
+    @timed_stage("m2_mirror_sync")
+    def _sync_m2_mirror(self):
+        """
+        Bring the local copy of the M2 serial number (C) and date columns up to date.
+        
+        As in _sync_m2, only the rows from the last mirrored row down are
+        fetched, and the last mirrored row is compared as a check: if it
+        changed, the mirror is rebuilt from row 2.
+        """
+        with self._m2_lock:
+            last = self.db.get_m2_last_row(self.tenant)
+            start_row = last.row if last is not None else 2
+            serials, dates = self._read_m2_columns(start_row)
+            
+            full = last is None
+            if not full:
+                first_serial = self._m2_serial(serials[0] if serials else "")
+                if first_serial != last.serial:
+                    logger.warning("M2 sheet changed above the last mirrored row, rebuilding the mirror")
+                    start_row = 2
+                    serials, dates = self._read_m2_columns(start_row)
+                    full = True
+                else:
+                    serials, dates = serials[1:], dates[1:]
+                    start_row += 1
+            
+            rows = [
+                {'row': row, 'serial': self._m2_serial(serial), 'day': parse_m2_date(date_value)}
+                for row, (serial, date_value) in enumerate(zip_longest(serials, dates, fillvalue=""),
+                                                           start=start_row)
+            ]
+            if not self.db.apply_sheet_rows(M2SheetRow, self.tenant, rows, replace=full):
+                raise RuntimeError("Failed to store the M2 sheet mirror")
+            logger.info("M2 sheet mirror synced", extra={"tenant": self.tenant, "full": full, "added": len(rows)})
+
+    def _read_m2_columns(self, start_row):
+        ranges = [f"C{start_row}:C", f"{self.m2_date_column}{start_row}:{self.m2_date_column}"]
+        value_ranges = self.sheets.call(self.plikM2, self.m2_sheet.batch_get, ranges,
+                                        major_dimension=gspread.utils.Dimension.cols)
+        return [value_range[0] if value_range else [] for value_range in value_ranges]
+
+    @staticmethod
+    def _m2_serial(value):
+        # Empty cells are stored as ""
+        return str(value) if value is not None and str(value).strip() else ""
+
+    def _reset_m2(self):
+        self._m2_values = []
+        self._m2_index = {}
+        self._m2_next_row = 1
+        self._m2_last_cell = ""
+
+    def last_m2_value(self, fresh=False):
+        """
+        Return the last non-empty value of M2 column C after a sync, without
+        copying the column.
+        
+        Args:
+            fresh: Sync even if the copy is within its TTL
+            
+        Returns:
+            The last value, None if there is none
+        """
+        self.sync_m2(fresh=fresh)
+        return self._last_synced_m2_value()
+
+    def _last_synced_m2_value(self):
+        if self.sheet_mirror:
+            return self.db.get_m2_last_serial(self.tenant)
+        with self._m2_lock:
+            return self._m2_values[-1] if self._m2_values else None
+        
+    def save_last(self, batch=None, last_value=None):
+        """
+        Save the last value from M2 column C to cell A7 of the Config sheet.
+        
+        Args:
+            batch: Optional SheetWriteBatch to queue the update in. The M2 data
+                synced earlier in the same run is reused instead of read again,
+                and the caller commits the batch.
+            last_value: Value to save, e.g. the one a count was based on
+                (default: the last value after a sync)
+                
+        Returns:
+            The saved value
+        """
+        if last_value is None:
+            last_value = self.last_m2_value(fresh=batch is None)
+
+        if last_value:
+            # Save the last value to cell A7 in config sheet
+            if batch is None:
+                self.sheets.call(self.orders_sheet_id, self.config_sheet.update, range_name='A7', values=[[last_value]])
+                self.cache.set("last_sn", last_value)
+                logger.info("Last value from M2 saved to Config", extra={"last_value": last_value})
+            else:
+                batch.update(self.config_sheet, 'A7', [[last_value]])
+            return last_value
+        else:
+            raise ValueError("No valid data found in M2.")
+
+    def read_last_sn(self, fresh=False):
+        """
+        Read the last saved serial number from cell A7 of the Config sheet.
+        
+        Args:
+            fresh: Bypass the cache
+            
+        Returns:
+            str: The saved serial number
+        """
+        return self.cache.get("last_sn", self._read_last_sn, self.cache_ttl["last_sn"],
+                              fresh=fresh, fallback_on_error=True)
+
+    @timed_stage("last_sn_read")
+    def _read_last_sn(self):
+        # Get column A from config sheet
+        column_a_values = self.sheets.call(self.orders_sheet_id, self.config_sheet.col_values, 1,  # Column A is index 1
+                                           coalesce_key="config_column_a")
+        
+        # Get value at row 7 (index 6 since list is 0-indexed)
+        last_sn = column_a_values[6] if len(column_a_values) > 6 else None
+        
+        if not last_sn:
+            raise ValueError("No last_sn found in A7")
+
+        return last_sn
+
+    def count_since(self, last_sn):
+        """
+        Count how many values were added to M2 after last_sn, using the data
+        from the last sync_m2 call.
+        
+        Args:
+            last_sn: Last saved serial number
+            
+        Returns:
+            int: Number of values added after last_sn
+        """
+        if self.sheet_mirror:
+            count = self.db.count_m2_since(self.tenant, str(last_sn))
+            if count is None:
+                raise ValueError(f"Last saved serial number {last_sn} not found in M2")
+            return count
+        
+        with self._m2_lock:
+            if not self._m2_values:
+                raise ValueError("No M2 data found")
+            
+            position = self._m2_index.get(str(last_sn))
+            if position is None:
+                raise ValueError(f"Last saved serial number {last_sn} not found in M2")
+            
+            return len(self._m2_values) - position - 1
+
+    def count_since_and_last(self, last_sn):
+        """
+        Return count_since(last_sn) and the last M2 value, taken from the same
+        synced state: a sync running in between can't add rows that the count
+        doesn't include but the saved last value skips.
+        
+        Args:
+            last_sn: Last saved serial number
+            
+        Returns:
+            tuple: (number of values added after last_sn, last value)
+        """
+        with self._m2_lock:
+            return self.count_since(last_sn), self._last_synced_m2_value()
+
+    def show_count(self, fresh=False):
+        """
+        Count how many new values were added to M2 data since the last saved serial number.
+        
+        Args:
+            fresh: Bypass the cache
+            
+        Returns:
+            int: Number of new values added since last_sn
+        """
+        try:
+            last_sn = self.read_last_sn(fresh=fresh)
+            self.sync_m2(fresh=fresh)
+            return self.count_since(last_sn)
+        except Exception as e:
+            # Don't report 0 when the sheets couldn't be read
+            logger.error("Error counting daily values", extra={"error": str(e)})
+            raise
+
+    @timed_stage("daily_count")
+    def daily_count(self):
+        """
+        Get daily count, save it to output sheet based on current date, and update last saved value.
+        """
+        try:
+            # Get current date in CEST timezone (UTC+2)
+            current_date = datetime.now()
+            
+            # Get day and month
+            day = current_date.day
+            month = current_date.month
+            
+            # Get the column for current month
+            column = MONTH_COLUMNS.get(month)
+            if not column:
+                raise ValueError(f"Invalid month: {month}")
+            
+            # Calculate row (day + 1 because row 1 is header, so day 1 = row 2, day 25 = row 26)
+            row = day + 1
+            
+            # Count from a fresh M2 sync; the saved last value is the one the
+            # count ran up to
+            last_sn = self.read_last_sn(fresh=True)
+            self.sync_m2(fresh=True)
+            count, last_value = self.count_since_and_last(last_sn)
+            
+            # Both cells are in the Orders spreadsheet, so they are written
+            # with a single batch update
+            batch = SheetWriteBatch(gateway=self.sheets)
+            cell_address = f"{column}{row}"
+            batch.update(self.output_sheet, cell_address, [[count]])
+            self.save_last(batch, last_value=last_value)
+            batch.commit()
+            self.cache.set("last_sn", last_value)
+            
+            logger.info("Daily count saved", extra={
+                "count": count, "cell": cell_address, "date": current_date.strftime('%d.%m.%Y'),
+                "last_value": last_value,
+            })
+            
+            return count
+            
+        except Exception as e:
+            logger.error("Error in daily_count", extra={"error": str(e)})
+            raise e
+
+    @timed_stage("backfill")
+    def backfill_daily_counts(self, start_date, end_date):
+        """
+        Recompute the Szukajka daily counts for every day from start_date to end_date.
+        
+        The M2 dates and serial numbers are read once with a single batch_get,
+        grouped per day in one pass, and the days in range are written as one
+        contiguous range per month column, all in a single batch update.
+        Other cells (including formulas) are never read or written.
+        
+        Args:
+            start_date: First day to recompute (date)
+            end_date: Last day to recompute (date)
+            
+        Returns:
+            dict: Count per day ('YYYY-MM-DD') for every day in the range
+            
+        Raises:
+            ValueError: If some non-empty M2 row (or every one) has no valid
+                date in M2_DATE_COLUMN; nothing is written then
+        """
+        if start_date > end_date:
+            raise ValueError("start_date must not be after end_date")
+        if start_date.year != end_date.year:
+            # The Szukajka sheet has no year dimension
+            raise ValueError("Backfill range must be within a single year")
+        
+        if self.sheet_mirror:
+            # Delta sync, then group the mirrored rows by day in the DB
+            self.sync_m2(fresh=True)
+            day_counts, dated, unparsed = self.db.count_m2_per_day(self.tenant, start_date, end_date)
+            counts = Counter(day_counts)
+        else:
+            # Read dates and serial numbers in one call (row 1 is the header)
+            serial_column, date_column = self._read_m2_columns(2)
+            
+            # Group non-empty serial numbers by day in a single pass
+            counts = Counter()
+            dated = unparsed = 0
+            for date_value, serial in zip_longest(date_column, serial_column, fillvalue=""):
+                if not str(serial).strip():
+                    continue
+                day = parse_m2_date(date_value)
+                if day is None:
+                    unparsed += 1
+                    continue
+                dated += 1
+                if start_date <= day <= end_date:
+                    counts[day] += 1
+        
+        # Zeros from a misconfigured date column would overwrite the real
+        # counts, so nothing is written unless every row has a valid date
+        if not dated:
+            raise ValueError(f"No M2 row has a valid date in column {self.m2_date_column}, "
+                             f"check M2_DATE_COLUMN")
+        if unparsed:
+            raise ValueError(f"{unparsed} M2 rows have no valid date in column {self.m2_date_column}, "
+                             f"nothing was written")
+        
+        # Day d of a month is row d + 1 of the month's column
+        result = {}
+        month_days = {}
+        day = start_date
+        while day <= end_date:
+            month_days.setdefault(day.month, []).append(day)
+            result[day.isoformat()] = counts[day]
+            day += timedelta(days=1)
+        
+        # One range per month column, e.g. F10:F31 and G2:G5, in one API call
+        batch = SheetWriteBatch(gateway=self.sheets)
+        for month, days in month_days.items():
+            column = MONTH_COLUMNS[month]
+            cell_range = f"{column}{days[0].day + 1}:{column}{days[-1].day + 1}"
+            batch.update(self.output_sheet, cell_range, [[counts[day]] for day in days])
+        batch.commit()
+        
+        logger.info("Backfilled daily counts", extra={"days": len(result), "months": len(month_days)})
+        return result
+
+    def iter_orders(self, status):
+        """
+        Walk every results page of the IdoSell order search for a status.
+        
+        Only one page is held in memory at a time, so callers that consume
+        the generator as a stream stay flat regardless of the backlog size.
+        
+        Args:
+            status: IdoSell order status, e.g. 'on_order'
+            
+        Yields:
+            dict: Orders returned by the search endpoint
+        """
+        yield from self._search_pages(self._status_params(status), f"'{status}'")
+
+    def iter_modified_orders(self, since, until):
+        """
+        Walk the orders (of any status) modified between since and until.
+        
+        Args:
+            since: Beginning of the range (aware datetime)
+            until: End of the range (aware datetime)
+            
+        Yields:
+            dict: Orders returned by the search endpoint
+        """
+        date_format = "%Y-%m-%d %H:%M:%S"
+        params = {
+            "ordersRange": {
+                "ordersDateRange": {
+                    "ordersDateType": "modified",
+                    "ordersDateBegin": since.astimezone(IDOSELL_TZ).strftime(date_format),
+                    "ordersDateEnd": until.astimezone(IDOSELL_TZ).strftime(date_format),
+                }
+            }
+        }
+        yield from self._search_pages(params, "zmienionych")
+
+    def _search_pages(self, params, label):
+        page = 0
+        
+        while True:
+            try:
+                data = self.idosell.search_orders(self._page_params(params, page))
+            except IdoSellError as e:
+                raise Exception(f"Błąd wyszukiwania zamówień {label}: {e.status_code}, {e.text}")
+            
+            results = data.get('Results', [])
+            yield from results
+            
+            page += 1
+            if self._is_last_page(data, results, page):
+                break
+
+    async def iter_orders_async(self, status):
+        """Async variant of iter_orders, using the async IdoSell client."""
+        params = self._status_params(status)
+        page = 0
+        
+        while True:
+            try:
+                data = await self.idosell_async.search_orders(self._page_params(params, page))
+            except IdoSellError as e:
+                raise Exception(f"Błąd wyszukiwania zamówień '{status}': {e.status_code}, {e.text}")
+            
+            results = data.get('Results', [])
+            for order in results:
+                yield order
+            
+            page += 1
+            if self._is_last_page(data, results, page):
+                break
+
+    @staticmethod
+    def _status_params(status):
+        return {"ordersStatuses": [status]}
+
+    def _page_params(self, params, page):
+        # Search params for one results page, shared by the sync and async walks
+        return dict(params, resultsPage=page, resultsLimit=self.page_size)
+
+    @staticmethod
+    def _is_last_page(data, results, next_page):
+        # Stop on the last page (or on an empty page if the count is missing)
+        pages = data.get('resultsNumberPage')
+        return not results or (pages is not None and next_page >= int(pages))
+
+    def count_orders(self, status, fresh=False):
+        """
+        Stream all orders with the given status into an OrderCounter.
+        
+        Args:
+            status: IdoSell order status, e.g. 'on_order'
+            fresh: Bypass the cache
+            
+        Returns:
+            OrderCounter: Counts of all and iPhone orders
+        """
+        if self.order_state_sync:
+            return self._count_orders_from_state(status, fresh)
+        # Fall back to the last counts when IdoSell is failing (or the circuit is open)
+        return self.cache.get(("orders", status), lambda: self._count_orders(status),
+                              self.cache_ttl["orders"], fresh=fresh, fallback_on_error=True)
+
+    async def count_orders_async(self, status, fresh=False):
+        """Async variant of count_orders, sharing its cache entries."""
+        if self.order_state_sync:
+            # The sync and the count query use the sync client and DB session
+            return await asyncio.to_thread(self.count_orders, status, fresh)
+        return await self.cache.get_async(("orders", status), lambda: self._count_orders_async(status),
+                                          self.cache_ttl["orders"], fresh=fresh, fallback_on_error=True)
+
+    @timed_stage("idosell_orders")
+    async def _count_orders_async(self, status):
+        counter = OrderCounter()
+        async for order in self.iter_orders_async(status):
+            counter.add(order)
+        return counter
+
+    @timed_stage("idosell_orders")
+    def _count_orders_from_state(self, status, fresh):
+        self.sync_order_state(fresh=fresh)
+        orders_count, iphone_count = self.db.count_order_states(TRACKED_ORDER_STATUSES, self.tenant)[status]
+        return OrderCounter(orders_count, iphone_count)
+
+    def sync_order_state(self, fresh=False):
+        """
+        Bring the OrderState table up to date, at most once per CACHE_TTL_ORDERS.
+        
+        Args:
+            fresh: Sync even if the last sync is within the TTL
+        """
+        # Both statuses share one sync; if it fails the last stored state is counted
+        self.cache.get("order_state", self._sync_order_state, self.cache_ttl["orders"],
+                       fresh=fresh, fallback_on_error=True)
+
+    @timed_stage("order_state_sync")
+    def _sync_order_state(self):
+        """
+        Apply the IdoSell order changes since the last sync to the OrderState table.
+        
+        Only orders modified since the cursor (minus ORDER_SYNC_OVERLAP, for
+        clock skew and late commits) are fetched: orders with a tracked
+        status are upserted, the others removed. A full download of the
+        tracked statuses replaces the table on the first sync and every
+        ORDER_FULL_RESYNC_HOURS, which also drops orders deleted in IdoSell.
+        
+        Returns:
+            int: Number of orders fetched
+        """
+        started_at = datetime.now(timezone.utc)
+        # Cursors are kept per tenant
+        sync_cursor = f"{self.tenant}:{ORDER_SYNC_CURSOR}"
+        full_sync_cursor = f"{self.tenant}:{ORDER_FULL_SYNC_CURSOR}"
+        cursor = self.db.get_sync_cursor(sync_cursor)
+        full_sync_at = self.db.get_sync_cursor(full_sync_cursor)
+        full = cursor is None or full_sync_at is None or started_at - full_sync_at >= self.order_full_resync
+        
+        rows, removed_ids = {}, set()
+        if full:
+            for status in TRACKED_ORDER_STATUSES:
+                for order in self.iter_orders(status):
+                    row = self._order_state_row(order, started_at, status)
+                    rows[row['order_id']] = row
+            cursors = {sync_cursor: started_at, full_sync_cursor: started_at}
+        else:
+            for order in self.iter_modified_orders(cursor - self.order_sync_overlap, started_at):
+                row = self._order_state_row(order, started_at)
+                # The same order can show up on two pages if it changes mid-sync
+                if row['status'] in TRACKED_ORDER_STATUSES:
+                    rows[row['order_id']] = row
+                    removed_ids.discard(row['order_id'])
+                else:
+                    rows.pop(row['order_id'], None)
+                    removed_ids.add(row['order_id'])
+            cursors = {sync_cursor: started_at}
+        
+        if not self.db.apply_order_changes(self.tenant, list(rows.values()), removed_ids,
+                                           cursors=cursors, replace=full):
+            raise RuntimeError("Failed to store the order state")
+        logger.info("Order state synced", extra={
+            "tenant": self.tenant, "full": full, "upserted": len(rows), "removed": len(removed_ids)
+        })
+        return len(rows) + len(removed_ids)
+
+    @staticmethod
+    def _order_state_row(order, synced_at, status=None):
+        details = order.get('orderDetails', {})
+        return {
+            'order_id': str(order.get('orderId') or order.get('orderSerialNumber')),
+            'status': status or details.get('orderStatus'),
+            'is_iphone': OrderCounter.is_iphone_order(order),
+            'synced_at': synced_at,
+        }
+
+    def _count_orders(self, status):
+        counter = OrderCounter()
+        for order in self.iter_orders(status):
+            counter.add(order)
+        return counter
+
+    def build_order_stats(self, realizowane, oczekuje):
+        """
+        Count all, iPhone and non-iPhone orders for each category.
+        
+        Args:
+            realizowane: OrderCounter for status 'on_order'
+            oczekuje: OrderCounter for status 'wait_for_dispatch'
+            
+        Returns:
+            dict: Counts keyed by category ('realizowane', 'oczekuje', 'wszystko')
+        """
+        # Combine for "wszystko" category
+        categories = {
+            'realizowane': realizowane,
+            'oczekuje': oczekuje,
+            'wszystko': realizowane + oczekuje
+        }
+        
+        return {category: counter.as_dict() for category, counter in categories.items()}
+
+    def search_orders(self, fresh=False):
+        """
+        Fetch 'on_order' and 'wait_for_dispatch' orders and count them.
+        
+        Args:
+            fresh: Bypass the cache
+            
+        Returns:
+            dict: Counts keyed by category ('realizowane', 'oczekuje', 'wszystko')
+        """
+        realizowane = self.count_orders("on_order", fresh=fresh)
+        oczekuje = self.count_orders("wait_for_dispatch", fresh=fresh)
+        return self.build_order_stats(realizowane, oczekuje)
+
+    @timed_stage("collect_counts")
+    def collect_counts(self, fresh=False):
+        """
+        Gather everything /search_orders needs: order stats, new orders count
+        and the count of values added to M2 since the last save.
+        
+        In concurrent mode the five independent upstream calls (two IdoSell
+        searches, Orders, Config and M2 reads) run in parallel, so the wall
+        time is that of the slowest call. Each call is bounded by call_timeout.
+        
+        Every read goes through the cache, so within the TTLs (and the stale
+        window) this returns without waiting for the upstream services.
+        
+        Args:
+            fresh: Bypass the cache
+            
+        Returns:
+            tuple: (stats, new_orders_count, wykonane_count)
+        """
+        if not self.concurrent_fetch:
+            return self.search_orders(fresh), self.count_new(fresh), self.show_count(fresh)
+
+        deadline = time.monotonic() + self.call_timeout
+        # Run in copies of the caller's context, so cache.track_age() sees the reads
+        submit = lambda *call: self._executor.submit(contextvars.copy_context().run, *call)
+        futures = {
+            "on_order": submit(self.count_orders, "on_order", fresh),
+            "wait_for_dispatch": submit(self.count_orders, "wait_for_dispatch", fresh),
+            "count_new": submit(self.count_new, fresh),
+            "last_sn": submit(self.read_last_sn, fresh),
+            "m2_sync": submit(self.sync_m2, fresh),
+        }
+
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeoutError:
+                raise TimeoutError(f"Upstream call '{name}' timed out after {self.call_timeout}s")
+
+        stats = self.build_order_stats(results["on_order"], results["wait_for_dispatch"])
+        wykonane_count = self.count_since(results["last_sn"])
+
+        return stats, results["count_new"], wykonane_count
+
+    @timed_stage("collect_counts")
+    async def collect_counts_async(self, fresh=False):
+        """
+        Async variant of collect_counts for async routes.
+        
+        The IdoSell searches run on the event loop with the async client.
+        gspread has no async API, so the Sheets reads run in worker threads
+        (still through the cache and the Sheets gateway). All five calls run
+        concurrently and together are bounded by call_timeout.
+        
+        Args:
+            fresh: Bypass the cache
+            
+        Returns:
+            tuple: (stats, new_orders_count, wykonane_count)
+        """
+        try:
+            realizowane, oczekuje, new_orders_count, last_sn, _ = await asyncio.wait_for(asyncio.gather(
+                self.count_orders_async("on_order", fresh),
+                self.count_orders_async("wait_for_dispatch", fresh),
+                asyncio.to_thread(self.count_new, fresh),
+                asyncio.to_thread(self.read_last_sn, fresh),
+                asyncio.to_thread(self.sync_m2, fresh),
+            ), timeout=self.call_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Upstream calls timed out after {self.call_timeout}s")
+        
+        stats = self.build_order_stats(realizowane, oczekuje)
+        wykonane_count = self.count_since(last_sn)
+        
+        return stats, new_orders_count, wykonane_count
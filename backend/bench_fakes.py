@@ -0,0 +1,354 @@
+"""
+Local stand-ins for the upstream services, used by benchmark.py.
+
+- FakeClient: in-memory gspread client/spreadsheet/worksheet answering the
+  calls the backend makes (get_all_records, row_values, col_values, get,
+  batch_get, update, values_batch_update).
+- IdoSellStub: local HTTP server for /orders/orders/search with
+  configurable latency, result size and error rate.
+- build_adam_fixture: spreadsheets shaped like the real Orders/Config/
+  Szukajka and M2 "Dane" sheets, at a given scale.
+"""
+import json
+import random
+import re
+import threading
+import time
+import zoneinfo
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import gspread
+
+_RANGE_PART = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def _parse_range(a1_range):
+    """
+    Parse an A1 range ("A7", "C5:C", "B2:M32") into 1-based
+    (first_row, first_col, last_row, last_col); open ends are None.
+    """
+    start, _, end = a1_range.partition(":")
+    end = end or start
+    bounds = []
+    for part in (start, end):
+        letters, digits = _RANGE_PART.match(part).groups()
+        col = gspread.utils.a1_to_rowcol(f"{letters}1")[1] if letters else None
+        bounds.append((int(digits) if digits else None, col))
+    (first_row, first_col), (last_row, last_col) = bounds
+    return first_row or 1, first_col or 1, last_row, last_col
+
+
+def _trim(rows):
+    """Drop trailing empty cells and rows, as the Sheets API does."""
+    rows = [list(row) for row in rows]
+    for row in rows:
+        while row and row[-1] in ("", None):
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+class FakeWorksheet:
+    """In-memory worksheet. cells_sent counts the cells returned by reads."""
+
+    def __init__(self, spreadsheet, title, values=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.values = [[str(cell) for cell in row] for row in values or []]
+        self.cells_sent = 0
+        self._lock = threading.Lock()
+
+    def _read(self, a1_range):
+        first_row, first_col, last_row, last_col = _parse_range(a1_range)
+        with self._lock:
+            last_row = last_row or len(self.values)
+            rows = []
+            for row in self.values[first_row - 1:last_row]:
+                end = last_col if last_col is not None else len(row)
+                rows.append(row[first_col - 1:end])
+        rows = _trim(rows)
+        self.cells_sent += sum(len(row) for row in rows)
+        return rows
+
+    def _read_columns(self, a1_range):
+        first_row, first_col, last_row, last_col = _parse_range(a1_range)
+        with self._lock:
+            rows = self.values[first_row - 1:last_row or len(self.values)]
+            last_col = last_col or max((len(row) for row in rows), default=0)
+            columns = [[row[col] if col < len(row) else "" for row in rows]
+                       for col in range(first_col - 1, last_col)]
+        for column in columns:
+            while column and column[-1] == "":
+                column.pop()
+        while columns and not columns[-1]:
+            columns.pop()
+        self.cells_sent += sum(len(column) for column in columns)
+        return columns
+
+    def get(self, range_name):
+        return self._read(range_name)
+
+    def batch_get(self, ranges, major_dimension=None):
+        result = []
+        for a1_range in ranges:
+            if major_dimension == gspread.utils.Dimension.cols:
+                result.append(self._read_columns(a1_range))
+            else:
+                result.append(self._read(a1_range))
+        return result
+
+    def row_values(self, row):
+        return (self._read(f"A{row}:{row}") or [[]])[0]
+
+    def col_values(self, col):
+        letter = gspread.utils.rowcol_to_a1(1, col).rstrip("0123456789")
+        return [row[0] if row else "" for row in self._read(f"{letter}1:{letter}")]
+
+    def get_all_records(self):
+        rows = self._read("A1:ZZ")
+        header, body = rows[0], rows[1:]
+        body = [gspread.utils.numericise_all(row + [""] * (len(header) - len(row))) for row in body]
+        return gspread.utils.to_records(header, body)
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self.write(range_name, values)
+
+    def write(self, a1_range, values):
+        first_row, first_col, _, _ = _parse_range(a1_range)
+        with self._lock:
+            for row_offset, row_values in enumerate(values):
+                row_index = first_row - 1 + row_offset
+                while len(self.values) <= row_index:
+                    self.values.append([])
+                row = self.values[row_index]
+                for col_offset, value in enumerate(row_values):
+                    col_index = first_col - 1 + col_offset
+                    row.extend([""] * (col_index + 1 - len(row)))
+                    # The API returns every value as a (formatted) string
+                    row[col_index] = str(value)
+
+
+class FakeSpreadsheet:
+    """In-memory spreadsheet holding FakeWorksheets by title."""
+
+    def __init__(self, spreadsheet_id):
+        self.id = spreadsheet_id
+        self.worksheets = {}
+        self.batch_updates = 0
+
+    def add_worksheet(self, title, values=None):
+        self.worksheets[title] = FakeWorksheet(self, title, values)
+        return self.worksheets[title]
+
+    def worksheet(self, title):
+        try:
+            return self.worksheets[title]
+        except KeyError:
+            raise gspread.exceptions.WorksheetNotFound(title)
+
+    def values_batch_update(self, body):
+        self.batch_updates += 1
+        for update in body["data"]:
+            title, _, a1_range = update["range"].rpartition("!")
+            self.worksheet(title.strip("'")).write(a1_range, update["values"])
+
+
+class FakeClient:
+    """gspread client stand-in; latency (seconds) is added to every open_by_key."""
+
+    def __init__(self, spreadsheets, latency=0.0):
+        self.spreadsheets = {spreadsheet.id: spreadsheet for spreadsheet in spreadsheets}
+        self.latency = latency
+
+    def set_timeout(self, timeout):
+        pass
+
+    def open_by_key(self, key):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.spreadsheets[key]
+
+
+ORDERS_HEADER = ["r_id", "r_date", "r_customer", "r_state", "r_item_name", "r_sku", "r_price", "r_notes"]
+ITEM_NAMES = ["Apple iPhone 13 128GB", "Samsung Galaxy S21", "iPad Air", "Lenovo ThinkPad T14"]
+
+
+def orders_rows(rows, seed=0):
+    """Rows of a synthetic Orders sheet, header included."""
+    rng = random.Random(seed)
+    states = ["NEW", "ACCEPTED", "SHIPPED", "CANCELLED"]
+    return [ORDERS_HEADER] + [
+        [str(i), "2025-01-01", f"Customer {i}", rng.choice(states), rng.choice(ITEM_NAMES),
+         f"SKU-{i}", "999.00", ""]
+        for i in range(rows)
+    ]
+
+
+def m2_rows(rows, days=60, end=None):
+    """Rows of a synthetic M2 "Dane" sheet: date in column A, serial number in column C."""
+    end = end or date.today()
+    per_day = max(rows // days, 1)
+    values = [["date", "model", "serial"]]
+    for i in range(rows):
+        day = end - timedelta(days=max(days - 1 - i // per_day, 0))
+        values.append([day.strftime("%Y-%m-%d 10:00"), "M2", f"SN{i:08d}"])
+    return values
+
+
+def build_adam_fixture(orders_sheet_id, m2_sheet_id, orders=100_000, m2=20_000, new_since_last=50):
+    """
+    Build a FakeClient with the spreadsheets Adam reads and writes.
+
+    Args:
+        orders_sheet_id: Key of the Orders/Config/Szukajka spreadsheet
+        m2_sheet_id: Key of the M2 spreadsheet
+        orders: Rows in the Orders sheet
+        m2: Serial numbers in the M2 sheet
+        new_since_last: M2 serial numbers after the one saved in Config!A7
+    """
+    orders_spreadsheet = FakeSpreadsheet(orders_sheet_id)
+    orders_spreadsheet.add_worksheet("Orders", orders_rows(orders))
+    config = [[""] for _ in range(7)]
+    config[6] = [f"SN{max(m2 - 1 - new_since_last, 0):08d}"]
+    orders_spreadsheet.add_worksheet("Config", config)
+    orders_spreadsheet.add_worksheet("Szukajka", [["day"] + [str(month) for month in range(1, 13)]])
+
+    m2_spreadsheet = FakeSpreadsheet(m2_sheet_id)
+    m2_spreadsheet.add_worksheet("Dane", m2_rows(m2))
+    return FakeClient([orders_spreadsheet, m2_spreadsheet])
+
+
+class IdoSellStub:
+    """
+    Local HTTP stand-in for the IdoSell order search.
+
+    Serves POST /orders/orders/search with paginated Results, filtered by
+    ordersStatuses and/or a "modified" ordersDateRange. Every request waits
+    latency seconds and fails with a 503 with probability error_rate.
+    change_orders() simulates order updates for incremental syncs.
+    """
+
+    DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, orders_per_status, latency=0.0, error_rate=0.0, iphone_ratio=0.2, seed=0):
+        """
+        Args:
+            orders_per_status: Dict of status -> number of orders
+            latency: Seconds added to every response
+            error_rate: Fraction of requests answered with 503
+            iphone_ratio: Fraction of orders containing an iPhone
+            seed: Seed of the generated orders and errors
+        """
+        rng = random.Random(seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._rng = rng
+        self._lock = threading.Lock()
+        created = self._now(timedelta(days=-1))
+        self.orders = [
+            self._order(f"{status}-{i}", status, rng.random() < iphone_ratio, created)
+            for status, count in orders_per_status.items()
+            for i in range(count)
+        ]
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @classmethod
+    def _now(cls, offset=timedelta(0)):
+        return (datetime.now(zoneinfo.ZoneInfo("Europe/Warsaw")) + offset).strftime(cls.DATE_FORMAT)
+
+    @staticmethod
+    def _order(order_id, status, iphone, changed_at):
+        products = [{"productName": "Apple iPhone 13 128GB" if iphone else "Samsung Galaxy S21"},
+                    {"productName": "Charger"}]
+        return {"orderId": order_id, "orderDetails": {
+            "orderStatus": status, "orderChangeDate": changed_at, "productsResults": products,
+        }}
+
+    def change_orders(self, count, status):
+        """Move count random orders to status, marking them modified now."""
+        changed_at = self._now()
+        with self._lock:
+            for order in self._rng.sample(self.orders, min(count, len(self.orders))):
+                order["orderDetails"] = dict(order["orderDetails"], orderStatus=status, orderChangeDate=changed_at)
+
+    def counts(self, status):
+        """(orders, iPhone orders) with status, as Adam should count them."""
+        with self._lock:
+            orders = [order for order in self.orders if order["orderDetails"]["orderStatus"] == status]
+        iphone = sum(1 for order in orders if "iPhone" in order["orderDetails"]["productsResults"][0]["productName"])
+        return len(orders), iphone
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="idosell-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def search(self, params):
+        """Build the response of a search request (status code, body)."""
+        with self._lock:
+            self.requests += 1
+            failed = self._rng.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return 503, {"errors": {"faultString": "Service unavailable"}}
+
+        with self._lock:
+            orders = list(self.orders)
+        statuses = params.get("ordersStatuses")
+        if statuses:
+            orders = [order for order in orders if order["orderDetails"]["orderStatus"] in statuses]
+        date_range = params.get("ordersRange", {}).get("ordersDateRange")
+        if date_range:
+            begin, end = date_range["ordersDateBegin"], date_range["ordersDateEnd"]
+            orders = [order for order in orders if begin <= order["orderDetails"]["orderChangeDate"] <= end]
+        limit = int(params.get("resultsLimit", 100))
+        page = int(params.get("resultsPage", 0))
+        pages = (len(orders) + limit - 1) // limit
+        return 200, {
+            "Results": orders[page * limit:(page + 1) * limit],
+            "resultsNumberAll": len(orders),
+            "resultsNumberPage": pages,
+            "resultsPage": page,
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; avoid Nagle/delayed-ACK stalls
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("content-length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.rstrip("/").endswith("/orders/orders/search"):
+                    status, body = stub.search(payload.get("params", {}))
+                else:
+                    status, body = 404, {"errors": {"faultString": "Not found"}}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,455 @@
+"""
+Benchmarks for the Adam backend.
+
+Usage:
+    python benchmark.py [--runs N] [--offline] [--clients N] [--url URL]
+                        [--orders N] [--idosell-orders N] [--latency S] [--error-rate F]
+                        [--max-p95-ms SCENARIO=MS ...]
+
+The cold/warm and fan-out scenarios run against the live services, so they
+need the same environment as the API (IDOSELL_API_KEY, GCLOUD_CREDENTIALS_JSON,
+M2_M47_PLIK, ...). Nothing is written to the database or to the sheets.
+--offline runs only the scenarios that use synthetic data.
+
+The endpoint scenario runs /search_orders and /save_daily end to end on the
+stand-ins from bench_fakes (in-memory sheets, a local IdoSell HTTP server)
+and SQLite (URL_DATABASE, a temporary file by default).
+
+The sheet mirror scenario checks count_new, show_count and backfill on the
+local mirror against the live (fake) sheets after every delta sync.
+
+The /get_data load test runs the app in-process (no lifespan, seeded with a
+synthetic payload) unless --url points it at a running server.
+
+--max-p95-ms sets a latency budget for a scenario (see SCENARIOS), e.g.
+--max-p95-ms search_orders_cached=50 --max-p95-ms get_data_load=20. The
+script exits with status 1 if any measured p95 is over its budget.
+"""
+import argparse
+import json
+import asyncio
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+import tempfile
+
+import httpx
+
+from bench_fakes import IdoSellStub, build_adam_fixture
+
+# The app module needs a database URL at import time
+os.environ.setdefault("URL_DATABASE", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'adam-benchmark.db')}")
+import main
+from adam import Adam
+
+
+def _pipeline(adam_instance):
+    """Run the read part of /search_orders against an Adam instance."""
+    adam_instance.search_orders(fresh=True)
+    adam_instance.count_new(fresh=True)
+    adam_instance.show_count(fresh=True)
+
+
+def bench_cold_vs_warm(runs):
+    """
+    Compare a request that builds a fresh Adam (old behaviour) with one that
+    reuses the process-wide client.
+    """
+    cold_init, cold_total = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        adam_instance = Adam()
+        adam_instance.warm_up()
+        initialized = time.perf_counter()
+        _pipeline(adam_instance)
+        end = time.perf_counter()
+        cold_init.append(initialized - start)
+        cold_total.append(end - start)
+
+    # First call pays for the shared client, later calls reuse it
+    main.get_adam().warm_up()
+    warm_total = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        _pipeline(main.get_adam())
+        warm_total.append(time.perf_counter() - start)
+
+    print(f"cold request: {_summary(cold_total, 'cold_request')} (init {_summary(cold_init)})")
+    print(f"warm request: {_summary(warm_total, 'warm_request')}")
+
+
+def bench_fan_out(runs):
+    """Compare sequential and concurrent upstream calls of /search_orders."""
+    adam_instance = main.get_adam()
+    adam_instance.warm_up()
+    original_mode = adam_instance.concurrent_fetch
+    try:
+        for concurrent in (False, True):
+            adam_instance.concurrent_fetch = concurrent
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                adam_instance.collect_counts(fresh=True)
+                samples.append(time.perf_counter() - start)
+            label = "concurrent" if concurrent else "sequential"
+            print(f"{label} fetch: {_summary(samples, f'fetch_{label}')}")
+    finally:
+        adam_instance.concurrent_fetch = original_mode
+
+
+def bench_count_new(runs, rows=50_000):
+    """Compare get_all_records with the projected Orders read on a synthetic sheet."""
+    adam_instance = _offline_adam(build_adam_fixture(ORDERS_SHEET_ID, M2_SHEET_ID, orders=rows))
+    sheet = adam_instance.orders_sheet
+
+    for projected, method in ((False, adam_instance._count_new_records),
+                              (True, adam_instance._count_new_projected)):
+        samples = []
+        sheet.cells_sent = 0
+        for _ in range(runs):
+            start = time.perf_counter()
+            count = method()
+            samples.append(time.perf_counter() - start)
+        label = "projected" if projected else "get_all_records"
+        print(f"count_new {label} ({rows} rows, result {count}): {_summary(samples, f'count_new_{label}')}, "
+              f"{sheet.cells_sent // runs} cells per call")
+
+
+ORDERS_SHEET_ID = "benchmark-orders"
+M2_SHEET_ID = "benchmark-m2"
+
+
+def _offline_adam(client, idosell_url="http://127.0.0.1:9"):
+    """Build an Adam on fake sheets, talking to a local IdoSell stand-in."""
+    os.environ.update({
+        "IDOSELL_API_KEY": "benchmark",
+        "IDOSELL_API_BASE_URL": idosell_url,
+        "REFURBED_PLIK": ORDERS_SHEET_ID,
+        "M2_M47_PLIK": M2_SHEET_ID,
+    })
+    adam_instance = Adam(client=client)
+    # Local data, no Sheets quota to protect
+    adam_instance.sheets.requests_per_minute = 10 ** 9
+    return adam_instance
+
+
+def bench_endpoints(runs, orders=100_000, idosell_orders=10_000, latency=0.05, error_rate=0.0):
+    """
+    End-to-end /search_orders and /save_daily against fake sheets, the
+    IdoSell stand-in and SQLite, through the ASGI app.
+    """
+    half = idosell_orders // 2
+    stub = IdoSellStub({"on_order": half, "wait_for_dispatch": idosell_orders - half},
+                       latency=latency, error_rate=error_rate).start()
+    try:
+        client = build_adam_fixture(ORDERS_SHEET_ID, M2_SHEET_ID, orders=orders)
+        adam_instance = _offline_adam(client, stub.base_url)
+        main.db.create_tables()
+        main._adam_instances[main.default_tenant] = adam_instance
+
+        async def timed_get(http, path, samples):
+            start = time.perf_counter()
+            response = await http.get(path)
+            samples.append(time.perf_counter() - start)
+            body = response.json()
+            if response.status_code != 200 or "error" in body or body.get("status") == "error":
+                raise RuntimeError(f"{path} failed: {body}")
+
+        async def run():
+            uncached, cached, save_daily = [], [], []
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+                for _ in range(runs):
+                    adam_instance.cache.invalidate()
+                    await timed_get(http, "/search_orders", uncached)
+                for _ in range(runs):
+                    await timed_get(http, "/search_orders", cached)
+                for _ in range(runs):
+                    await timed_get(http, "/save_daily", save_daily)
+            return uncached, cached, save_daily
+
+        uncached, cached, save_daily = asyncio.run(run())
+        scale = f"{orders} Orders rows, {idosell_orders} IdoSell orders, {latency * 1000:.0f} ms latency"
+        print(f"/search_orders uncached ({scale}): {_summary(uncached, 'search_orders_uncached')}, "
+              f"{stub.requests} IdoSell requests")
+        print(f"/search_orders cached: {_summary(cached, 'search_orders_cached')}")
+        print(f"/save_daily: {_summary(save_daily, 'save_daily')}")
+    finally:
+        stub.stop()
+
+
+def bench_order_state(runs, idosell_orders=10_000, latency=0.05, changes=50):
+    """
+    Compare counting the orders by downloading every tracked order with the
+    incremental OrderState sync (changes modified orders per refresh).
+    """
+    half = idosell_orders // 2
+    stub = IdoSellStub({"on_order": half, "wait_for_dispatch": idosell_orders - half},
+                       latency=latency).start()
+    try:
+        adam_instance = _offline_adam(build_adam_fixture(ORDERS_SHEET_ID, M2_SHEET_ID, orders=10), stub.base_url)
+        main.db.create_tables()
+
+        full = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            for status in ("on_order", "wait_for_dispatch"):
+                adam_instance._count_orders(status)
+            full.append(time.perf_counter() - start)
+
+        # Rebuild the OrderState rows left by a previous run
+        adam_instance.order_state_sync = True
+        adam_instance.order_full_resync = timedelta(0)
+        start = time.perf_counter()
+        adam_instance._sync_order_state()
+        initial = time.perf_counter() - start
+        adam_instance.order_full_resync = timedelta(days=1)
+
+        incremental = []
+        rng = random.Random(0)
+        for _ in range(runs):
+            stub.change_orders(changes, rng.choice(["on_order", "wait_for_dispatch", "finished"]))
+            start = time.perf_counter()
+            adam_instance._sync_order_state()
+            counts = adam_instance.db.count_order_states(("on_order", "wait_for_dispatch"), adam_instance.tenant)
+            incremental.append(time.perf_counter() - start)
+            for status, (orders_count, iphone_count) in counts.items():
+                if (orders_count, iphone_count) != stub.counts(status):
+                    raise RuntimeError(f"OrderState counts for {status} drifted: "
+                                       f"{(orders_count, iphone_count)} != {stub.counts(status)}")
+
+        print(f"order counts, full download ({idosell_orders} orders): {_summary(full, 'order_counts_full')}")
+        print(f"order counts, OrderState sync: initial {initial * 1000:.0f} ms, "
+              f"incremental ({changes} changes) {_summary(incremental, 'order_counts_incremental')}")
+    finally:
+        stub.stop()
+
+
+def bench_sheet_mirror(runs, orders=100_000, changes=50):
+    """
+    Compare count_new, show_count and backfill read live from the sheets with
+    the local mirror after a delta sync (changes edited and appended rows,
+    and one row inserted mid-sheet, which makes the mirror rebuild).
+    """
+    client = build_adam_fixture(ORDERS_SHEET_ID, M2_SHEET_ID, orders=orders)
+    live = _offline_adam(client)
+    mirrored = _offline_adam(client)
+    mirrored.sheet_mirror = True
+    main.db.create_tables()
+    orders_sheet = client.spreadsheets[ORDERS_SHEET_ID].worksheet("Orders")
+    m2_sheet = client.spreadsheets[M2_SHEET_ID].worksheet("Dane")
+    end = date.today()
+    start = end - timedelta(days=30)
+
+    # Rebuild the mirror left by a previous run
+    mirrored.sheet_mirror_full_resync = timedelta(0)
+    begin = time.perf_counter()
+    mirrored._count_new_from_mirror()
+    mirrored._sync_m2_mirror()
+    initial = time.perf_counter() - begin
+    mirrored.sheet_mirror_full_resync = timedelta(days=1)
+
+    samples = {(name, mode): [] for name in ("count_new", "show_count", "backfill") for mode in ("live", "mirror")}
+    rng = random.Random(0)
+    for run in range(runs):
+        for row in rng.sample(range(1, len(orders_sheet.values)), changes):
+            orders_sheet.values[row][3] = rng.choice(["NEW", "SHIPPED"])
+        # A row inserted mid-sheet shifts every row below it
+        position = rng.randrange(2, len(orders_sheet.values))
+        orders_sheet.values.insert(position, list(orders_sheet.values[rng.randrange(1, len(orders_sheet.values))]))
+        for i in range(changes):
+            m2_sheet.values.append([end.strftime("%Y-%m-%d 10:00"), "M2", f"SNB{run:03d}{i:05d}"])
+
+        results = {}
+        for mode, adam_instance in (("live", live), ("mirror", mirrored)):
+            count_new = mirrored._count_new_from_mirror if mode == "mirror" else live._count_new_projected
+            for name, call in (("count_new", count_new),
+                               ("show_count", lambda: adam_instance.show_count(fresh=True)),
+                               ("backfill", lambda: adam_instance.backfill_daily_counts(start, end))):
+                begin = time.perf_counter()
+                results[name, mode] = call()
+                samples[name, mode].append(time.perf_counter() - begin)
+        for name in ("count_new", "show_count", "backfill"):
+            if results[name, "live"] != results[name, "mirror"]:
+                raise RuntimeError(f"Mirror {name} drifted: {results[name, 'mirror']} != {results[name, 'live']}")
+
+    print(f"sheet mirror initial sync ({orders} Orders rows): {initial * 1000:.0f} ms")
+    for name in ("count_new", "show_count", "backfill"):
+        print(f"{name} live: {_summary(samples[name, 'live'], f'{name}_live')}, "
+              f"mirror with delta sync ({changes} changes, 1 insert): {_summary(samples[name, 'mirror'], f'{name}_mirror')}")
+
+
+def bench_get_data_load(clients, requests_per_client=20, url=None):
+    """Hit /get_data from many concurrent clients and report throughput and latency."""
+    if url is None:
+        notifier = main.notifiers[main.default_tenant]
+        if notifier.etag is None:
+            notifier.publish({
+                "output_realizowane": "12", "output_oczekuje": "3", "output_combined": "40",
+                "output_nie_dodane": "25", "output_wykonane": "7", "timestamp": "12:00",
+            })
+        transport = httpx.ASGITransport(app=main.app)
+        base_url = "http://benchmark"
+    else:
+        transport = None
+        base_url = url.rstrip("/")
+
+    async def client_loop(client, samples):
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            response = await client.get("/get_data")
+            response.raise_for_status()
+            samples.append(time.perf_counter() - start)
+
+    async def run():
+        samples = []
+        limits = httpx.Limits(max_connections=clients)
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(client_loop(client, samples) for _ in range(clients)))
+            elapsed = time.perf_counter() - start
+        return samples, elapsed
+
+    samples, elapsed = asyncio.run(run())
+    p50 = statistics.median(samples) * 1000
+    p95 = _p95(samples) * 1000
+    print(f"/get_data load ({clients} clients, {len(samples)} requests): "
+          f"{len(samples) / elapsed:.0f} req/s, p50 {p50:.1f} ms, p95 {p95:.1f} ms")
+    _check_budget("get_data_load", samples)
+
+
+# Run in a fresh interpreter: import the app, answer one /get_data, then load
+# the Sheets/IdoSell stack that the first Adam construction would import
+# Runs the real app lifespan (ASGITransport alone doesn't), so the startup
+# work of a cold start is part of the measurement
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+import asyncio, httpx
+UPSTREAM = ("gspread", "google.auth", "requests")
+result = {}
+async def cold_start():
+    async with main.app.router.lifespan_context(main.app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            await client.get("/get_data")
+        answered = time.perf_counter()
+        result.update(lifespan=started - imported, first_get_data=answered - started,
+                      stack_loaded=[name for name in UPSTREAM if name in sys.modules])
+asyncio.run(cold_start())
+print(json.dumps(dict(result, import_main=imported - start)))
+"""
+
+
+def bench_startup(runs):
+    """
+    Cold start with the lifespan running: app import, startup, first
+    /get_data, and whether the Sheets/IdoSell stack got loaded, with the
+    default settings and with WARM_UP_ON_START/REFRESH_ON_START enabled.
+    """
+    for label, scenario, flags in (("default", "startup", {}),
+                                   ("warm-up on start", "startup_warm_up",
+                                    {"WARM_UP_ON_START": "true", "REFRESH_ON_START": "true"})):
+        results = []
+        for _ in range(runs):
+            env = dict(os.environ, LOG_LEVEL="CRITICAL", **flags)
+            output = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT],
+                                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    env=env, capture_output=True, text=True, check=True)
+            results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        print(f"startup ({label}): import main {_summary([r['import_main'] for r in results])}, "
+              f"lifespan {_summary([r['lifespan'] for r in results])}, "
+              f"first /get_data {_summary([r['first_get_data'] for r in results])}, "
+              f"upstream stack loaded: {results[0]['stack_loaded'] or 'none'}")
+        # The budget covers the time from the app import to the first answer
+        _check_budget(scenario, [r["lifespan"] + r["first_get_data"] for r in results])
+
+
+# Scenario names accepted by --max-p95-ms
+SCENARIOS = (
+    "cold_request", "warm_request", "fetch_sequential", "fetch_concurrent",
+    "count_new_get_all_records", "count_new_projected",
+    "search_orders_uncached", "search_orders_cached", "save_daily",
+    "order_counts_full", "order_counts_incremental",
+    "count_new_live", "count_new_mirror", "show_count_live", "show_count_mirror",
+    "backfill_live", "backfill_mirror", "get_data_load", "startup", "startup_warm_up",
+)
+
+# scenario -> p95 budget in ms, and the budgets that were exceeded
+budgets = {}
+budget_failures = []
+
+
+def _summary(samples, scenario=None):
+    median = statistics.median(samples) * 1000
+    worst = max(samples) * 1000
+    if scenario is not None:
+        _check_budget(scenario, samples)
+    return f"median {median:.0f} ms, max {worst:.0f} ms"
+
+
+def _p95(samples):
+    # Nearest-rank percentile, so a handful of runs still gives a sample value
+    ordered = sorted(samples)
+    return ordered[math.ceil(len(ordered) * 0.95) - 1]
+
+
+def _check_budget(scenario, samples):
+    """Record a failure if the p95 of the scenario is over its --max-p95-ms budget."""
+    budget = budgets.pop(scenario, None)
+    if budget is None:
+        return
+    p95 = _p95(samples) * 1000
+    if p95 > budget:
+        budget_failures.append(f"{scenario}: p95 {p95:.1f} ms over the {budget:g} ms budget")
+
+
+def _parse_budget(value):
+    scenario, separator, ms = value.partition("=")
+    if not separator or scenario not in SCENARIOS:
+        raise argparse.ArgumentTypeError(f"expected SCENARIO=MS with SCENARIO one of {', '.join(SCENARIOS)}")
+    try:
+        return scenario, float(ms)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid budget in milliseconds: {ms!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Requests per scenario")
+    parser.add_argument("--offline", action="store_true", help="Only run scenarios with synthetic data")
+    parser.add_argument("--clients", type=int, default=100, help="Concurrent clients of the /get_data load test")
+    parser.add_argument("--url", help="Base URL of a running API for the /get_data load test")
+    parser.add_argument("--orders", type=int, default=100_000, help="Rows of the fake Orders sheet")
+    parser.add_argument("--idosell-orders", type=int, default=10_000, help="Orders served by the IdoSell stand-in")
+    parser.add_argument("--latency", type=float, default=0.05, help="IdoSell stand-in latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of IdoSell requests failing with 503")
+    parser.add_argument("--max-p95-ms", type=_parse_budget, action="append", default=[], metavar="SCENARIO=MS",
+                        help="Fail if the p95 latency of the scenario is over MS milliseconds (repeatable)")
+    args = parser.parse_args()
+    budgets.update(args.max_p95_ms)
+
+    if not args.offline:
+        bench_cold_vs_warm(args.runs)
+        bench_fan_out(args.runs)
+    bench_startup(args.runs)
+    bench_count_new(args.runs)
+    bench_endpoints(args.runs, args.orders, args.idosell_orders, args.latency, args.error_rate)
+    bench_order_state(args.runs, args.idosell_orders, args.latency)
+    bench_sheet_mirror(args.runs, args.orders)
+    bench_get_data_load(args.clients, url=args.url)
+
+    for scenario in budgets:
+        print(f"budget for {scenario} not checked: the scenario did not run")
+    if budget_failures:
+        print("Latency budgets exceeded:\n  " + "\n  ".join(budget_failures))
+        sys.exit(1)
@@ -0,0 +1,244 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def _metric_key(key) -> str:
+    # Tuple keys like ("orders", status) are counted under their first element
+    return str(key[0] if isinstance(key, tuple) else key)
+
+
+class ServedAge:
+    """Oldest load time of the cached values served inside a track_age() block."""
+
+    def __init__(self):
+        self.oldest = None
+        self._lock = threading.Lock()
+
+    def add(self, loaded_at: float):
+        """Record a value loaded at loaded_at (time.monotonic())."""
+        served = datetime.now(timezone.utc) - timedelta(seconds=time.monotonic() - loaded_at)
+        with self._lock:
+            if self.oldest is None or served < self.oldest:
+                self.oldest = served
+
+
+_served_age = contextvars.ContextVar("served_age", default=None)
+
+
+@contextmanager
+def track_age():
+    """
+    Track how old the cached values served in the block are.
+
+    Covers the current thread or task and whatever inherits its context
+    (asyncio tasks, asyncio.to_thread, functions run with
+    contextvars.copy_context().run).
+
+    Yields:
+        ServedAge: oldest is the UTC load time of the oldest value served,
+            None if no value was served
+    """
+    age = ServedAge()
+    token = _served_age.set(age)
+    try:
+        yield age
+    finally:
+        _served_age.reset(token)
+
+
+def _served(loaded_at: float):
+    age = _served_age.get()
+    if age is not None:
+        age.add(loaded_at)
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache for upstream reads.
+
+    Every key has its own TTL. Concurrent misses for the same key share a
+    single in-flight load (request coalescing). Values older than the TTL but
+    still within the stale window are returned immediately while a background
+    refresh runs (stale-while-revalidate).
+    """
+
+    def __init__(self, stale_ttl: float = 0, max_workers: int = 4):
+        """
+        Initialize the cache.
+
+        Args:
+            stale_ttl: Seconds after expiry during which a stale value is still served
+            max_workers: Threads used for background refreshes
+        """
+        self.stale_ttl = stale_ttl
+        self._entries = {}
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cache-refresh")
+
+    def get(self, key, loader, ttl: float, fresh: bool = False, fallback_on_error: bool = False):
+        """
+        Return the cached value for key, loading it with loader when needed.
+
+        Args:
+            key: Cache key
+            loader: Callable without arguments returning the value
+            ttl: Seconds a loaded value is considered fresh
+            fresh: Bypass the cached value and wait for a new load
+            fallback_on_error: If the load fails, return the last value
+                (however old) instead of raising. Never applies to fresh loads
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not fresh:
+                value, loaded_at = entry
+                age = time.monotonic() - loaded_at
+                if age < ttl:
+                    CACHE_REQUESTS.labels(key=_metric_key(key), result="hit").inc()
+                    _served(loaded_at)
+                    return value
+                if age < ttl + self.stale_ttl:
+                    # Serve the stale value, refresh in the background
+                    CACHE_REQUESTS.labels(key=_metric_key(key), result="stale").inc()
+                    if key not in self._inflight:
+                        future = self._inflight[key] = Future()
+                        self._executor.submit(self._load_in_background, key, loader, future)
+                    _served(loaded_at)
+                    return value
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            CACHE_REQUESTS.labels(key=_metric_key(key), result="miss" if leader else "coalesced").inc()
+
+        if leader:
+            self._load(key, loader, future)
+        try:
+            value = future.result()
+        except Exception as e:
+            if fallback_on_error and not fresh and entry is not None:
+                CACHE_REQUESTS.labels(key=_metric_key(key), result="fallback").inc()
+                logger.warning("Serving cached value after error", extra={"cache_key": str(key), "error": str(e)})
+                _served(entry[1])
+                return entry[0]
+            raise
+        _served(time.monotonic())
+        return value
+
+    async def get_async(self, key, loader, ttl: float, fresh: bool = False, fallback_on_error: bool = False):
+        """
+        asyncio variant of get() for coroutine loaders.
+
+        Shares the stored values with get(). Concurrent async misses for the
+        same key await a single load task; stale values are refreshed by a
+        background task.
+
+        Args:
+            key: Cache key
+            loader: Callable without arguments returning an awaitable value
+            ttl: Seconds a loaded value is considered fresh
+            fresh: Bypass the cached value and wait for a new load
+            fallback_on_error: If the load fails, return the last value
+                (however old) instead of raising. Never applies to fresh loads
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and not fresh:
+            value, loaded_at = entry
+            age = time.monotonic() - loaded_at
+            if age < ttl:
+                CACHE_REQUESTS.labels(key=_metric_key(key), result="hit").inc()
+                _served(loaded_at)
+                return value
+            if age < ttl + self.stale_ttl:
+                # Serve the stale value, refresh in the background
+                CACHE_REQUESTS.labels(key=_metric_key(key), result="stale").inc()
+                if key not in self._async_inflight:
+                    self._async_inflight[key] = asyncio.ensure_future(self._load_async(key, loader))
+                    self._async_inflight[key].add_done_callback(self._log_background_error(key))
+                _served(loaded_at)
+                return value
+
+        task = self._async_inflight.get(key)
+        CACHE_REQUESTS.labels(key=_metric_key(key), result="miss" if task is None else "coalesced").inc()
+        if task is None:
+            task = self._async_inflight[key] = asyncio.ensure_future(self._load_async(key, loader))
+        try:
+            value = await asyncio.shield(task)
+        except Exception as e:
+            if fallback_on_error and not fresh and entry is not None:
+                CACHE_REQUESTS.labels(key=_metric_key(key), result="fallback").inc()
+                logger.warning("Serving cached value after error", extra={"cache_key": str(key), "error": str(e)})
+                _served(entry[1])
+                return entry[0]
+            raise
+        _served(time.monotonic())
+        return value
+
+    async def _load_async(self, key, loader):
+        try:
+            value = await loader()
+            with self._lock:
+                self._entries[key] = (value, time.monotonic())
+            return value
+        finally:
+            self._async_inflight.pop(key, None)
+
+    @staticmethod
+    def _log_background_error(key):
+        def callback(task):
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Error refreshing cached value",
+                             extra={"cache_key": str(key), "error": str(task.exception())})
+        return callback
+
+    def set(self, key, value):
+        """Store a value that is known to be current (e.g. just written upstream)."""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _load(self, key, loader, future):
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._inflight.pop(key, None)
+        future.set_result(value)
+
+    def _load_in_background(self, key, loader, future):
+        self._load(key, loader, future)
+        if future.exception() is not None:
+            logger.error("Error refreshing cached value",
+                         extra={"cache_key": str(key), "error": str(future.exception())})
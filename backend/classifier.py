@@ -0,0 +1,102 @@
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Iterable
+
+IPHONE = "iphone"
+
+# Used when PRODUCT_RULES_JSON is not set: a product is an iPhone if its name
+# contains "iphone" (any case)
+DEFAULT_RULES = {IPHONE: {"keywords": ["iphone"]}}
+
+
+class ProductClassifier:
+    """
+    Assigns products to categories by name and product id.
+
+    A product belongs to every category whose rules match it, so adding a
+    category never changes the membership of another one. The keyword and
+    regex rules of each category are compiled into one case-insensitive
+    pattern. Results are memoized per product name, and the Orders sheet
+    and IdoSell repeat the same few hundred names.
+    """
+
+    def __init__(self, rules: dict, cache_size: int = 8192):
+        """
+        Initialize the classifier.
+
+        Args:
+            rules: category -> rule, where a rule has optional "keywords"
+                (substrings), "patterns" (regular expressions) and
+                "product_ids" (IdoSell productId or productCode values)
+            cache_size: Product names whose result is memoized
+        """
+        self.categories = list(rules)
+        self._product_ids = {}
+        self._patterns = []
+        for category, rule in rules.items():
+            terms = [re.escape(keyword) for keyword in rule.get("keywords", ())]
+            terms += [f"(?:{pattern})" for pattern in rule.get("patterns", ())]
+            if terms:
+                self._patterns.append((category, re.compile("|".join(terms), re.IGNORECASE)))
+            for product_id in rule.get("product_ids", ()):
+                self._product_ids.setdefault(str(product_id), set()).add(category)
+        self.classify_name = lru_cache(maxsize=cache_size)(self._classify_name)
+
+    def _classify_name(self, name: str) -> frozenset:
+        """Categories whose keyword or regex rules match the name."""
+        if not name:
+            return frozenset()
+        return frozenset(category for category, pattern in self._patterns if pattern.search(name))
+
+    def classify_product(self, product: dict) -> frozenset:
+        """Categories of an IdoSell product (productsResults entry), by product id and by name."""
+        categories = set(self.classify_name(product.get("productName") or ""))
+        for key in ("productId", "productCode"):
+            categories.update(self._product_ids.get(str(product.get(key)), ()))
+        return frozenset(categories)
+
+    def order_has(self, category: str, order: dict) -> bool:
+        """Return True if any product of an IdoSell order is in the category."""
+        products = order.get("orderDetails", {}).get("productsResults", [])
+        return any(category in self.classify_product(product) for product in products)
+
+    def classify_names(self, names: Iterable) -> list:
+        """
+        Classify a batch of product names (e.g. an Orders sheet column).
+
+        Each distinct name is classified once.
+
+        Returns:
+            list: Categories (a frozenset, empty if none matches) of every name, in order
+        """
+        names = [str(name) for name in names]
+        categories = {name: self.classify_name(name) for name in set(names)}
+        return [categories[name] for name in names]
+
+
+def load_rules() -> dict:
+    """
+    Load the classification rules from PRODUCT_RULES_JSON.
+
+    PRODUCT_RULES_JSON maps categories to rules, e.g.
+    {"iphone": {"keywords": ["iphone"], "patterns": ["apple\\s+phone"], "product_ids": ["1234"]}}.
+    The "iphone" category is required, it is the one the dashboard counts.
+
+    Returns:
+        dict: category -> rule
+    """
+    rules_json = os.environ.get("PRODUCT_RULES_JSON")
+    if not rules_json:
+        return DEFAULT_RULES
+    rules = json.loads(rules_json)
+    if IPHONE not in rules:
+        raise ValueError(f"PRODUCT_RULES_JSON must define the {IPHONE!r} category")
+    return rules
+
+
+@lru_cache(maxsize=None)
+def get_classifier() -> ProductClassifier:
+    """Return the process-wide classifier, built from the rules on first use."""
+    return ProductClassifier(load_rules())
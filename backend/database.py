@@ -1,4 +1,6 @@
+from functools import lru_cache
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 import os
@@ -12,14 +14,70 @@ if not URL_DATABASE:
     if not URL_DATABASE:
         raise ValueError("URL_DATABASE not set in environment or .env file")
 
-engine = create_engine(URL_DATABASE)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def engine_options(url):
+    """
+    Return the connection pool settings for the engine of a database URL.
+    
+    Sized for a long-running container: connections are checked before use
+    (pre-ping) and recycled before server/proxy idle timeouts close them.
+    SQLite (local testing) keeps SQLAlchemy's defaults.
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    }
+
+
+# Engines and session factories are created on first use, so importing the
+# app doesn't load the DB driver or open the pool before it is needed
+
+@lru_cache(maxsize=None)
+def get_engine():
+    return create_engine(URL_DATABASE, **engine_options(URL_DATABASE))
+
+
+@lru_cache(maxsize=None)
+def get_session_factory():
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+def async_database_url(url):
+    """Return the URL with the async driver of its backend (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        # asyncpg takes ssl instead of libpq's sslmode
+        query = dict(url.query)
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+
+@lru_cache(maxsize=None)
+def get_async_engine():
+    from sqlalchemy.ext.asyncio import create_async_engine
+    return create_async_engine(async_database_url(URL_DATABASE), **engine_options(URL_DATABASE))
+
+
+@lru_cache(maxsize=None)
+def get_async_session_factory():
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    return async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 def get_db():
-    db = SessionLocal()
+    db = get_session_factory()()
     try:
         yield db
     finally:
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import UPSTREAM_CALLS, timed
+
+logger = logging.getLogger(__name__)
+
+
+def _outcome(status_code: int) -> str:
+    return "ok" if status_code in (200, 207) else f"http_{status_code}"
+
+
+class IdoSellError(Exception):
+    """Raised when IdoSell answers with an error status."""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"{status_code}, {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling IdoSell while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures of an upstream service.
+
+    After failure_threshold failures the circuit opens and before_call()
+    raises CircuitOpenError for cooldown seconds. Then it is half-open: a
+    single caller gets through for a trial call while everybody else keeps
+    getting CircuitOpenError. The trial's success closes the circuit, its
+    failure re-opens it. A trial that never reports back is given up after
+    another cooldown.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started = None
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None and not self._trial_allowed(time.monotonic())
+
+    def _trial_allowed(self, now: float) -> bool:
+        if now - self._opened_at < self.cooldown:
+            return False
+        return self._trial_started is None or now - self._trial_started >= self.cooldown
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            if not self._trial_allowed(now):
+                UPSTREAM_CALLS.labels(service="idosell", outcome="circuit_open").inc()
+                raise CircuitOpenError("IdoSell circuit breaker is open, skipping call")
+            # Half-open: this caller makes the trial call
+            self._trial_started = now
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_started is not None or self._failures >= self.failure_threshold:
+                # A failed trial re-opens the circuit right away
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+                logger.warning("IdoSell circuit breaker opened",
+                               extra={"cooldown_s": self.cooldown, "failures": self._failures})
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+
+
+class IdoSellClient:
+    """
+    Shared HTTP client for the IdoSell admin API.
+
+    Uses one pooled keep-alive session, bounded timeouts and retries with
+    exponential backoff on 429/5xx (honoring Retry-After). After
+    failure_threshold consecutive failed calls the circuit opens and calls
+    fail fast with CircuitOpenError for cooldown seconds, after which a
+    single trial call is let through while the others keep failing fast
+    until it succeeds or fails.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url: str, api_key: str, connect_timeout: float = 5, read_timeout: float = 20,
+                 retries: int = 3, backoff_factor: float = 0.5, pool_size: int = 10,
+                 failure_threshold: int = 5, cooldown: float = 60):
+        """
+        Initialize the client.
+
+        Args:
+            base_url: Base URL of the admin API, e.g. https://shop.pl/api/admin/v5
+            api_key: IdoSell API key
+            connect_timeout: Seconds to wait for a connection
+            read_timeout: Seconds to wait for a response
+            retries: Retries of a failed call (429/5xx, connection errors)
+            backoff_factor: Base of the exponential backoff between retries
+            pool_size: Keep-alive connections kept in the pool
+            failure_threshold: Consecutive failures that open the circuit
+            cooldown: Seconds the circuit stays open
+        """
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "accept": "application/json",
+            "content-type": "application/json",
+            "X-API-KEY": api_key
+        })
+
+    @property
+    def circuit_open(self) -> bool:
+        return self.breaker.is_open
+
+    def post(self, path: str, payload: dict) -> dict:
+        """
+        POST a JSON payload and return the decoded response.
+
+        Args:
+            path: Endpoint path relative to base_url, e.g. /orders/orders/search
+            payload: JSON body
+
+        Returns:
+            dict: Decoded JSON response
+        """
+        self.breaker.before_call()
+        try:
+            with timed("idosell_post", path=path):
+                response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        except requests.RequestException:
+            UPSTREAM_CALLS.labels(service="idosell", outcome="error").inc()
+            self.breaker.record_failure()
+            raise
+        UPSTREAM_CALLS.labels(service="idosell", outcome=_outcome(response.status_code)).inc()
+
+        if response.status_code in self.RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        if response.status_code not in [200, 207]:
+            raise IdoSellError(response.status_code, response.text)
+        return response.json()
+
+    def search_orders(self, params: dict) -> dict:
+        """Call /orders/orders/search with the given params."""
+        return self.post("/orders/orders/search", {"params": params})
+
+
+class AsyncIdoSellClient:
+    """
+    asyncio counterpart of IdoSellClient, built on httpx.AsyncClient.
+
+    Same pooling, timeouts, retry policy (429/5xx with exponential backoff,
+    honoring Retry-After) and circuit breaker semantics.
+    """
+
+    RETRY_STATUSES = IdoSellClient.RETRY_STATUSES
+
+    def __init__(self, base_url: str, api_key: str, connect_timeout: float = 5, read_timeout: float = 20,
+                 retries: int = 3, backoff_factor: float = 0.5, pool_size: int = 10,
+                 breaker: CircuitBreaker = None):
+        """
+        Initialize the client. Arguments are as for IdoSellClient; pass the
+        sync client's breaker to share the circuit state with it.
+        """
+        self.base_url = base_url
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.breaker = breaker or CircuitBreaker()
+        self._client_args = dict(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            headers={
+                "accept": "application/json",
+                "content-type": "application/json",
+                "X-API-KEY": api_key
+            },
+        )
+        self._clients = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The pooled client of the running event loop (httpx clients are loop-bound)."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = self._clients[loop] = httpx.AsyncClient(**self._client_args)
+        return client
+
+    async def post(self, path: str, payload: dict) -> dict:
+        """
+        POST a JSON payload and return the decoded response.
+
+        Args:
+            path: Endpoint path relative to base_url, e.g. /orders/orders/search
+            payload: JSON body
+
+        Returns:
+            dict: Decoded JSON response
+        """
+        self.breaker.before_call()
+        attempt = 0
+        while True:
+            try:
+                with timed("idosell_post", path=path):
+                    response = await self.client.post(f"{self.base_url}{path}", json=payload)
+                UPSTREAM_CALLS.labels(service="idosell", outcome=_outcome(response.status_code)).inc()
+            except httpx.TransportError:
+                UPSTREAM_CALLS.labels(service="idosell", outcome="error").inc()
+                if attempt >= self.retries:
+                    self.breaker.record_failure()
+                    raise
+                response = None
+
+            if response is not None and response.status_code not in self.RETRY_STATUSES:
+                break
+            if response is not None and attempt >= self.retries:
+                break
+            await asyncio.sleep(self._retry_delay(response, attempt))
+            attempt += 1
+
+        if response.status_code in self.RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        if response.status_code not in [200, 207]:
+            raise IdoSellError(response.status_code, response.text)
+        return response.json()
+
+    async def search_orders(self, params: dict) -> dict:
+        """Call /orders/orders/search with the given params."""
+        return await self.post("/orders/orders/search", {"params": params})
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients = {}
+
+    def _retry_delay(self, response, attempt: int) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return max(float(retry_after), 0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+                except (TypeError, ValueError):
+                    pass
+        delay = self.backoff_factor * (2 ** attempt)
+        return delay + random.uniform(0, delay / 2)
@@ -1,320 +1,242 @@
+import asyncio
+import email.utils
+import logging
 import os
-import requests
 import json
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
 import zoneinfo
-from oauth2client.service_account import ServiceAccountCredentials
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request
-import gspread
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException
+from fastapi import Request as HTTPRequest
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from DatabaseManager import DatabaseManager
+from cache import track_age
+from DatabaseManager import SNAPSHOT_FIELDS, AsyncDatabaseManager, DatabaseManager
+from scheduler import Job, Scheduler
+from notifier import ChangeNotifier
+from metrics import IDOSELL_CIRCUIT_OPEN, SHEETS_BUDGET_USED, configure_logging, timed, timed_stage
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from models import Adam as AdamModel
-class Adam:
-    def __init__(self):
-        """Initialize the IdoSell API client with credentials."""
-        # First try to get API key from environment variable
-        self.ids_key = os.environ.get("IDOSELL_API_KEY")
-        
-        # If not found in environment variable, try to get from tokens file
-        if not self.ids_key:
-            try:
-                with open("/home/vis/Projects/refurbed/keys/tokens.json", "r") as f:
-                    tokens = json.load(f)
-                    self.ids_key = tokens.get("idosell_api_key")
-            except (FileNotFoundError, json.JSONDecodeError, KeyError):
-                # Handle any errors loading from file
-                pass
-        
-        if not self.ids_key:
-            raise ValueError("IdoSell API key must be provided as IDOSELL_API_KEY environment variable or in tokens.json file")
-        
-        # === Google Sheets Setup ===
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        
-        # Try to get credentials from environment variable
-        creds_json = os.environ.get("GCLOUD_CREDENTIALS_JSON")
-        
-        if creds_json:
-            # Use credentials from environment variable
-            self.creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(creds_json), scope)
-        else:
-            # Fallback to loading from file
-            credentials_file_path = "/home/vis/Projects/Adam/keys/ref-ids-6c3ebadcd9f8.json"
-            try:
-                self.creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_file_path, scope)
-            except FileNotFoundError:
-                raise FileNotFoundError(f"Google credentials not found in environment variable or at {credentials_file_path}")
-        
-        self.client = gspread.authorize(self.creds)
+from tenants import load_tenants
 
+# The Sheets/IdoSell stack (gspread, google-auth, requests, httpx) is only
+# imported by adam.py, which is loaded on the first get_adam() call. Routes
+# serving stored data (/get_data, /stream, /get_history) never load it.
 
-        self.orders_sheet_id = os.environ.get("REFURBED_PLIK")
-        if not self.orders_sheet_id:
-            self.orders_sheet_id = "15e6oc33_A21dNNv03wqdixYc9_mM2GTQzum9z2HylEg"
-            
-        self.plikM2 = os.environ.get("M2_M47_PLIK")
-        if not self.plikM2:
-            raise ValueError("M2_M47_PLIK must be provided as environment variable")
+configure_logging()
+logger = logging.getLogger(__name__)
 
-        # Open Orders Google Sheet
-        self.orders_sheet = self.client.open_by_key(self.orders_sheet_id).worksheet("Orders")
+# Database managers shared by all routes and jobs (sessions come from the pooled engine)
+db = DatabaseManager()
+async_db = AsyncDatabaseManager()
 
-        self.config_sheet = self.client.open_by_key(self.orders_sheet_id).worksheet("Config")
-        
-        self.output_sheet = self.client.open_by_key(self.orders_sheet_id).worksheet("Szukajka")
+# Shops/warehouses served by the dashboard (see tenants.py). Requests without
+# ?tenant= use the first one
+tenants = load_tenants()
+default_tenant = next(iter(tenants))
 
-        self.m2_sheet = self.client.open_by_key(self.plikM2).worksheet("Dane")
+# Process-wide Adam client per tenant, created on first use and shared by all requests
+_adam_instances = {}
+_adam_lock = threading.Lock()
+
+# Bounded pool refreshing the tenants in parallel
+_tenant_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("TENANT_REFRESH_WORKERS", "4")),
+    thread_name_prefix="tenant-refresh",
+)
 
-        # Base URL for API requests
-        self.base_url = os.environ.get("IDOSELL_API_BASE_URL", "https://vedion.pl/api/admin/v5")
-        
-        # Default headers for requests for IdoSell
-        self.ids_headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "X-API-KEY": self.ids_key
-        }
-        
-    def count_new(self):
-        """
-        Count rows from the Orders sheet where r_state is 'NEW' and r_item_name does not contain 'iphone'.
-        
-        Returns:
-            int: Number of rows matching the criteria
-        """
-        try:
-            # Get all data from the Orders sheet
-            all_data = self.orders_sheet.get_all_records()
-            
-            # Counter for matching rows
-            count = 0
-            
-            # Check each row
-            for row in all_data:
-                # Check if 'r_state' column exists and equals 'NEW'
-                if 'r_state' in row and row['r_state'] == 'NEW':
-                    # Check if 'r_item_name' column exists and doesn't contain 'iphone'
-                    if 'r_item_name' in row and 'iphone' not in str(row['r_item_name']).lower():
-                        count += 1
-            
-            return count
-            
-        except Exception as e:
-            print(f"Error counting new non-iPhone orders: {str(e)}")
-            return 0
 
-    def read_data_from_M2(self):
-        """
-        Read data from column C of the M2 sheet.
+def get_tenant(name=None):
+    """
+    Return the tenant with the given name.
+    
+    Args:
+        name: Tenant name, None for the default tenant
         
-        Returns:
-            list: List of values from column C (excluding empty values)
-        """
-        try:
-            # Get all values from column C
-            column_c_values = self.m2_sheet.col_values(3)  # Column C is index 3
-            
-            # Filter out empty values (handle different data types)
-            filtered_values = []
-            for value in column_c_values:
-                if value is not None and str(value).strip():
-                    filtered_values.append(value)
-            
-            # Return only the last 500 non-empty values
-            return filtered_values[-500:]
-            
-        except Exception as e:
-            print(f"Error reading column C from M2 sheet: {str(e)}")
-            return []
+    Returns:
+        Tenant: The tenant
         
-    def save_last(self):
-        data = self.read_data_from_M2()
-        last_value = data[-1] if data else None
-
-        if last_value:
-            # Save the last value to cell A7 in config sheet
-            self.config_sheet.update(range_name='A7', values=[[last_value]])
-            print(f"Last value from M2 saved to Config: {last_value}")
-        else:
-            raise ValueError("No valid data found in M2.")
-
-    def show_count(self):
-        """
-        Count how many new values were added to M2 data since the last saved serial number.
+    Raises:
+        HTTPException: 404 if there is no such tenant
+    """
+    tenant = tenants.get(name or default_tenant)
+    if tenant is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant {name}")
+    return tenant
+
+
+def get_adam(tenant=None):
+    """
+    Return the shared Adam client of a tenant, creating it on first use.
+    
+    Tenants share the authorized gspread client and the Sheets request
+    budget of the first instance; each has its own IdoSell client. If
+    construction fails (e.g. missing credentials) nothing is cached, so
+    the next call retries.
+    
+    Args:
+        tenant: Tenant name, None for the default tenant
         
-        Returns:
-            int: Number of new values added since last_sn
-        """
+    Returns:
+        Adam: The process-wide Adam instance of the tenant
+    """
+    tenant = get_tenant(tenant)
+    adam_instance = _adam_instances.get(tenant.name)
+    if adam_instance is None:
+        with _adam_lock:
+            adam_instance = _adam_instances.get(tenant.name)
+            if adam_instance is None:
+                with timed("adam_init", tenant=tenant.name):
+                    from adam import Adam
+                    shared = next(iter(_adam_instances.values()), None)
+                    if shared is None:
+                        adam_instance = Adam(tenant=tenant)
+                    else:
+                        adam_instance = Adam(client=shared.client, tenant=tenant, sheets=shared.sheets)
+                    _adam_instances[tenant.name] = adam_instance
+    return adam_instance
+
+
+def _warm_up_adam():
+    for name in tenants:
         try:
-            # Get column A from config sheet
-            column_a_values = self.config_sheet.col_values(1)  # Column A is index 1
-            
-            # Get value at row 7 (index 6 since list is 0-indexed)
-            last_sn = column_a_values[6] if len(column_a_values) > 6 else None
-            
-            if not last_sn:
-                print("No last_sn found in A7")
-                raise ValueError("No last_sn found in A7")
-            
-            # Get M2 data
-            m2_data = self.read_data_from_M2()
-            
-            if not m2_data:
-                print("No M2 data found")
-                raise ValueError("No M2 data found")
-            
-            # Count from the end until we find last_sn
-            count = 0
-            for i in range(len(m2_data) - 1, -1, -1):  # Start from end, go backwards
-                if str(m2_data[i]) == str(last_sn):
-                    break
-                count += 1
-            
-            return count
-            
+            get_adam(name).warm_up()
         except Exception as e:
-            print(f"Error counting daily values: {str(e)}")
-            return 0
+            logger.error("Error warming up Adam client", extra={"tenant": name, "error": str(e)})
 
-    def daily_count(self):
-        """
-        Get daily count, save it to output sheet based on current date, and update last saved value.
-        """
+
+def for_each_tenant(func, *args):
+    """
+    Run func(tenant_name, *args) for every tenant on the bounded worker pool.
+    
+    Every tenant runs even if another one fails.
+    
+    Raises:
+        RuntimeError: If func failed for any tenant
+    """
+    futures = {name: _tenant_executor.submit(func, name, *args) for name in tenants}
+    failed = []
+    for name, future in futures.items():
         try:
-            # Get current date in CEST timezone (UTC+2)
-            current_date = datetime.now()
-            
-            # Get day and month
-            day = current_date.day
-            month = current_date.month
-            
-            # Map month number to column letter (B=Jan, C=Feb, ..., M=Dec)
-            month_columns = {
-                1: 'B',   # January
-                2: 'C',   # February
-                3: 'D',   # March
-                4: 'E',   # April
-                5: 'F',   # May
-                6: 'G',   # June
-                7: 'H',   # July
-                8: 'I',   # August
-                9: 'J',   # September
-                10: 'K',  # October
-                11: 'L',  # November
-                12: 'M'   # December
-            }
-            
-            # Get the column for current month
-            column = month_columns.get(month)
-            if not column:
-                raise ValueError(f"Invalid month: {month}")
-            
-            # Calculate row (day + 1 because row 1 is header, so day 1 = row 2, day 25 = row 26)
-            row = day + 1
-            
-            # Get count from show_count method
-            count = self.show_count()
-            
-            # Save to output sheet at calculated cell
-            cell_address = f"{column}{row}"
-            self.output_sheet.update(range_name=cell_address, values=[[count]])
-            
-            print(f"Daily count {count} saved to {cell_address} for date {current_date.strftime('%d.%m.%Y')}")
-            
-            # Save last value
-            self.save_last()
-            
-            return count
-            
+            future.result()
         except Exception as e:
-            print(f"Error in daily_count: {str(e)}")
-            raise e
+            logger.error("Tenant job failed", extra={"tenant": name, "job": func.__name__, "error": str(e)})
+            failed.append(name)
+    if failed:
+        raise RuntimeError(f"{func.__name__} failed for tenants: {', '.join(failed)}")
 
-    def search_orders(self):
-        endpoint = f"{self.base_url}/orders/orders/search"
-        
-        payload_realizowane = {
-            "params": {
-                "ordersStatuses": [
-                "on_order"
-                ]
-            }
-        }
-        
-        payload_oczekuje = {
-            "params": {
-                "ordersStatuses": [
-                "wait_for_dispatch"
-                ]
-            }
-        }
-        
-        # Send first request for "realizowane" orders
-        response_realizowane = requests.post(endpoint, headers=self.ids_headers, json=payload_realizowane)
-        
-        # Send second request for "oczekuje" orders
-        response_oczekuje = requests.post(endpoint, headers=self.ids_headers, json=payload_oczekuje)
-        
-        orders_realizowane = []
-        orders_oczekuje = []
-        
-        # Process "realizowane" response
-        if response_realizowane.status_code in [200, 207]:
-            realizowane_data = response_realizowane.json()
-            if 'Results' in realizowane_data:
-                orders_realizowane = realizowane_data['Results']
-        else:
-            raise Exception(f"Błąd wyszukiwania zamówień 'on_order': {response_realizowane.status_code}, {response_realizowane.text}")
-            
-        # Process "oczekuje" response
-        if response_oczekuje.status_code in [200, 207]:
-            oczekuje_data = response_oczekuje.json()
-            if 'Results' in oczekuje_data:
-                orders_oczekuje = oczekuje_data['Results']
-        else:
-            raise Exception(f"Błąd wyszukiwania zamówień 'delivery_waiting': {response_oczekuje.status_code}, {response_oczekuje.text}")
-        
-        # Combine for "wszystko" category
-        combined_orders = orders_realizowane + orders_oczekuje
-        
-        # Calculate counts for each category
-        stats = {}
-        
-        categories = {
-            'realizowane': orders_realizowane,
-            'oczekuje': orders_oczekuje,
-            'wszystko': combined_orders
-        }
-        
-        for category, orders in categories.items():
-            orders_count = len(orders)
-            iphone_count = 0
-            
-            # Check each order for iPhone products
-            for order in orders:
-                if 'orderDetails' in order and 'productsResults' in order['orderDetails']:
-                    for product in order['orderDetails']['productsResults']:
-                        if 'productName' in product and 'iphone' in product['productName'].lower():
-                            iphone_count += 1
-                            break  # Count each order only once
-            
-            non_iphone_count = orders_count - iphone_count
-            
-            stats[category] = {
-                "orders_count": orders_count,
-                "iphone_count": iphone_count,
-                "non_iphone_count": non_iphone_count,
-            }
-        
-        return stats
 
-app = FastAPI()
+def _adam_outputs(stats, new_orders_count, wykonane_count):
+    """Turn the collected counts into update_adam_record arguments."""
+    total_combined = stats['wszystko']['non_iphone_count'] + new_orders_count
+    return {
+        "output_realizowane": f"{stats['realizowane']['non_iphone_count']}",
+        "output_oczekuje": f"{stats['oczekuje']['non_iphone_count']}",
+        "output_combined": f"{total_combined}",
+        "output_nie_dodane": f"{new_orders_count}",
+        "output_wykonane": f"{wykonane_count}",
+    }
+
+
+@timed_stage("refresh_adam_record")
+def refresh_adam_record(tenant=None, fresh=False):
+    """
+    Collect the current counts and store them in the tenant's Adam record.
+    
+    Args:
+        tenant: Tenant name, None for the default tenant
+        fresh: Bypass the upstream cache
+    """
+    tenant = get_tenant(tenant)
+    adam_instance = get_adam(tenant.name)
+    # Values served from the cache are stored with the time they were read
+    # upstream, so stale ones don't show up as current
+    with track_age() as age:
+        counts = adam_instance.collect_counts(fresh=fresh)
+    outputs = _adam_outputs(*counts)
+    if not db.update_adam_record(**outputs, record_id=tenant.record_id, created_at=age.oldest):
+        raise RuntimeError(f"Failed to update Adam record of tenant {tenant.name}")
+
+
+@timed_stage("refresh_adam_record")
+async def refresh_adam_record_async(tenant=None, fresh=False):
+    """Async variant of refresh_adam_record used by the async routes."""
+    tenant = get_tenant(tenant)
+    # The first call builds the client (blocking credential/file loading)
+    adam_instance = await run_in_threadpool(get_adam, tenant.name)
+    with track_age() as age:
+        counts = await adam_instance.collect_counts_async(fresh=fresh)
+    outputs = _adam_outputs(*counts)
+    if not await async_db.update_adam_record(**outputs, record_id=tenant.record_id, created_at=age.oldest):
+        raise RuntimeError(f"Failed to update Adam record of tenant {tenant.name}")
+
+
+def run_daily_count(tenant=None):
+    get_adam(tenant).daily_count()
+
+
+def prune_snapshots(tenant=None):
+    tenant = get_tenant(tenant)
+    deleted = db.prune_snapshots(
+        raw_days=int(os.environ.get("SNAPSHOT_RAW_DAYS", "7")),
+        retention_days=int(os.environ.get("SNAPSHOT_RETENTION_DAYS", "730")),
+        record_id=tenant.record_id,
+    )
+    logger.info("Pruned snapshots", extra={"tenant": tenant.name, "deleted": deleted})
+
+
+# Background jobs, started in the app lifespan:
+# - refresh_adam_record of every tenant every REFRESH_INTERVAL seconds (+ up to REFRESH_JITTER)
+# - daily_count of every tenant at DAILY_COUNT_AT (HH:MM, Warsaw time) if set; leave it unset
+#   when /save_daily is triggered by an external caller
+# - prune_snapshots of every tenant (history retention and downsampling) every night
+scheduler = Scheduler()
+if os.environ.get("SCHEDULER_ENABLED", "true").lower() == "true":
+    scheduler.add_job(Job(
+        "refresh_adam_record",
+        lambda: for_each_tenant(refresh_adam_record, True),
+        interval=float(os.environ.get("REFRESH_INTERVAL", "300")),
+        jitter=float(os.environ.get("REFRESH_JITTER", "30")),
+    ))
+    if os.environ.get("DAILY_COUNT_AT"):
+        scheduler.add_job(Job(
+            "daily_count",
+            lambda: for_each_tenant(run_daily_count),
+            daily_at=os.environ["DAILY_COUNT_AT"],
+            jitter=float(os.environ.get("DAILY_COUNT_JITTER", "0")),
+        ))
+    scheduler.add_job(Job("prune_snapshots", lambda: for_each_tenant(prune_snapshots), daily_at="03:30", jitter=600))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    try:
+        db.create_tables()
+    except Exception as e:
+        logger.error("Error creating database tables", extra={"error": str(e)})
+    # Both are off by default: with scale-to-zero hosting every cold start
+    # would load the Sheets/IdoSell stack and call upstream while the first
+    # /get_data is being answered
+    if os.environ.get("WARM_UP_ON_START", "false").lower() == "true":
+        # Warm up in the background so startup isn't blocked by Google/IdoSell
+        threading.Thread(target=_warm_up_adam, daemon=True).start()
+    scheduler.start()
+    if ("refresh_adam_record" in scheduler.jobs
+            and os.environ.get("REFRESH_ON_START", "false").lower() == "true"):
+        # Don't serve data from before the restart for a whole interval
+        scheduler.run_now("refresh_adam_record")
+    yield
+    scheduler.stop()
+    for adam_instance in list(_adam_instances.values()):
+        await adam_instance.idosell_async.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # Allow frontend to talk to backend (CORS)
@@ -326,27 +248,10 @@ app.add_middleware(
 )
 
 @app.get("/search_orders")
-def search_orders_route():
-    adam_instance = Adam()
-    db_manager = DatabaseManager()
+async def search_orders_route(tenant: Optional[str] = None):
+    get_tenant(tenant)
     try:
-        stats = adam_instance.search_orders()
-        new_orders_count = adam_instance.count_new()
-        wykonane_count = adam_instance.show_count()
-        output_realizowane = f"{stats['realizowane']['non_iphone_count']}"
-        output_oczekuje = f"{stats['oczekuje']['non_iphone_count']}"
-        output_nie_dodane = f"{new_orders_count}"
-        output_wykonane = f"{wykonane_count}"
-        total_combined = stats['wszystko']['non_iphone_count'] + new_orders_count
-        output_combined = f"{total_combined}"
-
-        db_manager.update_adam_record(
-            output_realizowane=output_realizowane,
-            output_oczekuje=output_oczekuje,
-            output_combined=output_combined,
-            output_nie_dodane=output_nie_dodane,
-            output_wykonane=output_wykonane
-        )
+        await refresh_adam_record_async(tenant)
 
         return JSONResponse(
             status_code=200,
@@ -360,42 +265,249 @@ def search_orders_route():
     
     
 @app.get("/save_daily")
-def save_daily():
-    adam_instance = Adam()
+def save_daily(tenant: Optional[str] = None):
+    get_tenant(tenant)
     try:
-        adam_instance.daily_count()
+        run_daily_count(tenant)
         return {"status": "success"}
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.get("/backfill")
+def backfill(start: date, end: date, tenant: Optional[str] = None):
+    """Recompute the Szukajka daily counts for start..end (inclusive)."""
+    get_tenant(tenant)
+    try:
+        adam_instance = get_adam(tenant)
+    except Exception as e:
+        return {"error": str(e)}
+    try:
+        counts = adam_instance.backfill_daily_counts(start, end)
+        return {"status": "success", "counts": counts}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/sheets_quota")
+def sheets_quota():
+    """Google Sheets request budget usage per spreadsheet (the budget is shared by all tenants)."""
+    try:
+        return get_adam().sheets.usage()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: stage latencies, upstream calls, cache lookups and errors."""
+    # Don't create the Adam clients just to be scraped
+    for name, adam_instance in list(_adam_instances.items()):
+        IDOSELL_CIRCUIT_OPEN.labels(tenant=name).set(int(adam_instance.idosell.circuit_open))
+        for spreadsheet_id, usage in adam_instance.sheets.usage().items():
+            SHEETS_BUDGET_USED.labels(spreadsheet=spreadsheet_id).set(usage["used_last_minute"])
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/scheduler_runs")
+def scheduler_runs():
+    """Recent runs of the background jobs, newest first."""
+    return {
+        "jobs": {
+            name: {"next_run": datetime.fromtimestamp(job.next_run, zoneinfo.ZoneInfo("Europe/Warsaw")).isoformat()}
+            for name, job in scheduler.jobs.items()
+        },
+        "runs": scheduler.history(),
+    }
+
+
+def adam_payload(adam_record):
+    """Build the dashboard payload served by /get_data and /stream."""
+    # Convert to Warsaw timezone
+    db_time = adam_record.created_at
+    warsaw_tz = zoneinfo.ZoneInfo("Europe/Warsaw")
+    warsaw_time = db_time.astimezone(warsaw_tz)
+    timestamp_str = warsaw_time.strftime("%H:%M")
+    
+    return {
+        "output_realizowane": adam_record.realizowane,
+        "output_oczekuje": adam_record.oczekuje,
+        "output_combined": adam_record.combined,
+        "output_nie_dodane": adam_record.nie_dodane,
+        "output_wykonane": adam_record.wykonane,
+        "timestamp": timestamp_str
+    }
+
+
+def publish_adam_record(adam_record):
+    """Materialize the payload of a new Adam record for /get_data and /stream."""
+    name = _tenant_by_record_id.get(adam_record.id)
+    if name is None:
+        return
+    last_modified = adam_record.created_at
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    _payload_checked_at[name] = time.monotonic()
+    notifiers[name].publish(adam_payload(adam_record), last_modified=last_modified)
+
+
+# Latest dashboard payload of every tenant, replaced on every update
+# committed by this process. Served from memory by /get_data and pushed to
+# /stream clients. Updates written by other instances (or directly to the
+# DB) are picked up by re-reading the record once the payload is older than
+# GET_DATA_MAX_AGE seconds.
+notifiers = {name: ChangeNotifier() for name in tenants}
+_tenant_by_record_id = {tenant.record_id: name for name, tenant in tenants.items()}
+_payload_checked_at = {}
+GET_DATA_MAX_AGE = float(os.environ.get("GET_DATA_MAX_AGE", "5"))
+DatabaseManager.add_adam_listener(publish_adam_record)
+
+
+async def _ensure_fresh_payload(tenant):
+    """Read the tenant's record if there is no payload yet or it is older than GET_DATA_MAX_AGE."""
+    now = time.monotonic()
+    if notifiers[tenant.name].etag is not None:
+        checked_at = _payload_checked_at.get(tenant.name)
+        if checked_at is not None and now - checked_at < GET_DATA_MAX_AGE:
+            return
+        # Claim the re-read, concurrent requests keep serving the current payload
+        _payload_checked_at[tenant.name] = now
+    adam_record = await async_db.get_by_id(AdamModel, tenant.record_id)
+    if adam_record:
+        publish_adam_record(adam_record)
+
+
+def _not_modified(request, etag, last_modified):
+    """Check the conditional request headers against the current payload."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")]
+        return etag in tags or "*" in tags
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
 @app.get("/get_data")
-def get_adam_data():
-    db_manager = DatabaseManager()
+async def get_adam_data(request: HTTPRequest, tenant: Optional[str] = None):
+    tenant = get_tenant(tenant)
+    notifier = notifiers[tenant.name]
     try:
-        # Get the record with id=1 from the Adam table
-        adam_record = db_manager.get_by_id(AdamModel, 1)
+        # The tenant's record is read from the DB at most once per GET_DATA_MAX_AGE
+        await _ensure_fresh_payload(tenant)
         
-        if adam_record:
-            # Convert to Warsaw timezone
-            db_time = adam_record.created_at
-            warsaw_tz = zoneinfo.ZoneInfo("Europe/Warsaw")
-            warsaw_time = db_time.astimezone(warsaw_tz)
-            timestamp_str = warsaw_time.strftime("%H:%M")
-            
-            return {
-                "output_realizowane": adam_record.realizowane,
-                "output_oczekuje": adam_record.oczekuje,
-                "output_combined": adam_record.combined,
-                "output_nie_dodane": adam_record.nie_dodane,
-                "output_wykonane": adam_record.wykonane,
-                "timestamp": timestamp_str
-            }
-        else:
-            return {"error": "No record found with id=1"}
+        payload, etag = notifier.current()
+        if payload is None:
+            return {"error": f"No record found with id={tenant.record_id}"}
+        
+        last_modified = notifier.last_modified
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if last_modified is not None:
+            headers["Last-Modified"] = email.utils.format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+        
+        if _not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content=payload, headers=headers)
             
     except Exception as e:
         return {"error": str(e)}
 
+
+async def _adam_events(tenant, last_event_id):
+    """Server-sent events with the dashboard payload, one per change."""
+    notifier = notifiers[tenant.name]
+    subscriber = notifier.subscribe()
+    _, event = subscriber
+    try:
+        # Ask the browser to reconnect after 5 s if the connection drops
+        yield "retry: 5000\n\n"
+        sent_etag = last_event_id
+        while True:
+            payload, etag = notifier.current()
+            if etag is not None and etag != sent_etag:
+                yield f"id: {etag}\nevent: adam\ndata: {json.dumps(payload)}\n\n"
+                sent_etag = etag
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(GET_DATA_MAX_AGE, 15) or 15)
+                event.clear()
+            except asyncio.TimeoutError:
+                # Pick up updates made elsewhere; keep proxies from closing an idle connection
+                await _ensure_fresh_payload(tenant)
+                yield ": keep-alive\n\n"
+    finally:
+        notifier.unsubscribe(subscriber)
+
+
+@app.get("/stream")
+async def stream(request: HTTPRequest, tenant: Optional[str] = None):
+    """
+    Push the tenant's dashboard payload whenever its Adam record changes.
     
-    
\ No newline at end of file
+    Every event carries the payload's ETag as its id. A reconnecting browser
+    sends it back in Last-Event-ID and only gets data that changed since.
+    """
+    tenant = get_tenant(tenant)
+    await _ensure_fresh_payload(tenant)
+    return StreamingResponse(
+        _adam_events(tenant, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+WARSAW_TZ = zoneinfo.ZoneInfo("Europe/Warsaw")
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Treat naive datetimes as Warsaw time and convert to UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=WARSAW_TZ)
+    return value.astimezone(timezone.utc)
+
+
+@app.get("/get_history")
+def get_history(start: Optional[datetime] = None, end: Optional[datetime] = None, tenant: Optional[str] = None):
+    """Snapshots of the tenant in [start, end), by default the last 24 hours."""
+    tenant = get_tenant(tenant)
+    end = _as_utc(end) if end else datetime.now(timezone.utc)
+    start = _as_utc(start) if start else end - timedelta(days=1)
+    try:
+        snapshots = db.get_snapshots(start, end, record_id=tenant.record_id)
+    except Exception as e:
+        return {"error": str(e)}
+    
+    result = []
+    for snapshot in snapshots:
+        created_at = snapshot.created_at
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        item = {"timestamp": created_at.astimezone(WARSAW_TZ).isoformat()}
+        item.update({field: getattr(snapshot, field) for field in SNAPSHOT_FIELDS})
+        result.append(item)
+    return {"snapshots": result}
+
+
+@app.get("/get_history_summary")
+def get_history_summary(bucket: str = "day", start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        tenant: Optional[str] = None):
+    """Per hour/day/month aggregates of the tenant in [start, end), by default the last 30 days."""
+    tenant = get_tenant(tenant)
+    end = _as_utc(end) if end else datetime.now(timezone.utc)
+    start = _as_utc(start) if start else end - timedelta(days=30)
+    try:
+        return {"bucket": bucket,
+                "summary": db.aggregate_snapshots(start, end, bucket, record_id=tenant.record_id)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return {"error": str(e)}
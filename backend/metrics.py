@@ -0,0 +1,108 @@
+import inspect
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# Seconds; covers cache hits (ms) up to slow Sheets/IdoSell calls
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Registered in prometheus_client's default registry, rendered by /metrics.
+# Counters are exported with a _total suffix
+STAGE_SECONDS = Histogram(
+    "adam_stage_seconds", "Duration of backend stages in seconds", ["stage"], buckets=STAGE_BUCKETS)
+STAGE_ERRORS = Counter(
+    "adam_stage_errors", "Backend stages that raised an exception", ["stage"])
+UPSTREAM_CALLS = Counter(
+    "adam_upstream_calls", "Calls to upstream services by outcome", ["service", "outcome"])
+CACHE_REQUESTS = Counter(
+    "adam_cache_requests", "Cache lookups by key and result (hit, stale, miss, coalesced, fallback)",
+    ["key", "result"])
+SHEETS_THROTTLED = Counter(
+    "adam_sheets_throttled", "Sheets calls that had to wait for request budget", ["spreadsheet"])
+SHEETS_BUDGET_USED = Gauge(
+    "adam_sheets_requests_last_minute", "Sheets requests charged in the last 60 s", ["spreadsheet"])
+IDOSELL_CIRCUIT_OPEN = Gauge(
+    "adam_idosell_circuit_open", "1 while the tenant's IdoSell circuit breaker is open", ["tenant"])
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def timed(stage: str, **fields):
+    """
+    Time a stage: observe its duration and count it as an error if it raises.
+
+    Args:
+        stage: Stage name used as the metric label
+        **fields: Extra context attached to the debug log record
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage=stage).inc()
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=stage).observe(duration)
+        logger.debug("stage finished", extra={"stage": stage, "duration_ms": round(duration * 1000, 1), **fields})
+
+
+def timed_stage(stage: str):
+    """Decorator version of timed() for sync functions and coroutines."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Attributes every LogRecord has; anything else was passed in extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line, including extra= fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging():
+    """
+    Set up root logging from LOG_LEVEL (default INFO) and LOG_FORMAT
+    ("json", the default, or "text").
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    if os.environ.get("LOG_FORMAT", "json").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, DateTime, BigInteger, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -14,3 +14,72 @@ class Adam(Base):
     combined = Column(String, nullable=True)
     nie_dodane = Column(String, nullable=True)
     wykonane = Column(String, nullable=True)
+
+
+class AdamSnapshot(Base):
+    """Append-only history of the Adam counts, one row per refresh of a record (tenant)."""
+    __tablename__ = 'AdamSnapshot'
+    
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    record_id = Column(BigInteger, nullable=False, default=1, server_default='1')
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    realizowane = Column(Integer, nullable=True)
+    oczekuje = Column(Integer, nullable=True)
+    combined = Column(Integer, nullable=True)
+    nie_dodane = Column(Integer, nullable=True)
+    wykonane = Column(Integer, nullable=True)
+    
+    # History of one record over a time range
+    __table_args__ = (Index('ix_AdamSnapshot_record_id_created_at', 'record_id', 'created_at'),)
+
+
+class OrderState(Base):
+    """Local copy of the open IdoSell orders, kept in sync incrementally."""
+    __tablename__ = 'OrderState'
+    
+    tenant = Column(String, primary_key=True)
+    order_id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)
+    is_iphone = Column(Boolean, nullable=False, default=False)
+    synced_at = Column(DateTime(timezone=True), nullable=False)
+    
+    # Counts per status are answered from this index alone
+    __table_args__ = (Index('ix_OrderState_tenant_status_is_iphone', 'tenant', 'status', 'is_iphone'),)
+
+
+class SyncState(Base):
+    """Cursor of an incremental sync, e.g. the last IdoSell modification date seen."""
+    __tablename__ = 'SyncState'
+    
+    name = Column(String, primary_key=True)
+    cursor = Column(DateTime(timezone=True), nullable=False)
+
+
+class OrdersSheetRow(Base):
+    """Local copy of the r_state, r_item_name and r_id columns of the Orders sheet, one row per sheet row."""
+    __tablename__ = 'OrdersSheetRow'
+    
+    tenant = Column(String, primary_key=True)
+    row = Column(Integer, primary_key=True)
+    r_state = Column(String, nullable=False, default="")
+    r_item_name = Column(String, nullable=False, default="")
+    # "" if the sheet has no r_id column
+    r_id = Column(String, nullable=False, default="", server_default="")
+    
+    __table_args__ = (Index('ix_OrdersSheetRow_tenant_r_state', 'tenant', 'r_state'),)
+
+
+class M2SheetRow(Base):
+    """Local copy of the serial number and date columns of the M2 "Dane" sheet, one row per sheet row."""
+    __tablename__ = 'M2SheetRow'
+    
+    tenant = Column(String, primary_key=True)
+    row = Column(Integer, primary_key=True)
+    serial = Column(String, nullable=False, default="")
+    # None if the date cell could not be parsed
+    day = Column(Date, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_M2SheetRow_tenant_serial', 'tenant', 'serial'),
+        Index('ix_M2SheetRow_tenant_day', 'tenant', 'day'),
+    )
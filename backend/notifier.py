@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+import json
+import threading
+
+
+class ChangeNotifier:
+    """
+    Holds the latest dashboard payload and wakes up async subscribers when it changes.
+
+    publish() may be called from any thread (e.g. a threadpool route or a
+    scheduler job). Every payload gets an ETag derived from its content, so
+    re-publishing identical data doesn't wake anybody up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.payload = None
+        self.etag = None
+        self.last_modified = None
+
+    @staticmethod
+    def compute_etag(payload) -> str:
+        body = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha1(body.encode("utf-8")).hexdigest()[:16]
+
+    def current(self):
+        """Return the latest (payload, etag) pair."""
+        with self._lock:
+            return self.payload, self.etag
+
+    def publish(self, payload, last_modified=None) -> bool:
+        """
+        Store a new payload and notify subscribers.
+
+        Args:
+            payload: JSON-serializable dashboard data
+            last_modified: When the underlying data changed (aware datetime)
+
+        Returns:
+            True if the payload changed, False if it was identical
+        """
+        etag = self.compute_etag(payload)
+        with self._lock:
+            if etag == self.etag:
+                return False
+            self.payload, self.etag = payload, etag
+            self.last_modified = last_modified
+            subscribers = list(self._subscribers)
+
+        for loop, event in subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+        return True
+
+    def subscribe(self):
+        """Register a subscriber; must be called from a running event loop."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
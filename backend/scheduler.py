@@ -0,0 +1,144 @@
+import logging
+import random
+import threading
+import time
+import zoneinfo
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """A named task run periodically or once a day by the Scheduler."""
+
+    def __init__(self, name: str, func: Callable, interval: Optional[float] = None,
+                 daily_at: Optional[str] = None, tz: str = "Europe/Warsaw", jitter: float = 0):
+        """
+        Initialize a job. Exactly one of interval and daily_at must be given.
+
+        Args:
+            name: Unique job name
+            func: Callable without arguments
+            interval: Seconds between runs
+            daily_at: Local time of the daily run, as "HH:MM"
+            tz: Timezone of daily_at
+            jitter: Random delay (seconds) added to every run, up to this value
+        """
+        if (interval is None) == (daily_at is None):
+            raise ValueError("Job needs exactly one of interval and daily_at")
+
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.daily_at = datetime.strptime(daily_at, "%H:%M").time() if daily_at else None
+        self.tz = zoneinfo.ZoneInfo(tz)
+        self.jitter = jitter
+        self.running = threading.Lock()
+        self.next_run = self.compute_next_run()
+
+    def compute_next_run(self) -> float:
+        """Return the epoch time of the next run."""
+        delay = random.uniform(0, self.jitter) if self.jitter else 0
+        if self.interval is not None:
+            return time.time() + self.interval + delay
+
+        now = datetime.now(self.tz)
+        run_at = datetime.combine(now.date(), self.daily_at, tzinfo=self.tz)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        return run_at.timestamp() + delay
+
+
+class Scheduler:
+    """
+    In-process scheduler running jobs on background threads.
+
+    A job that is still running when it becomes due again is skipped rather
+    than started twice. The outcome of every run is kept in a bounded history.
+    """
+
+    def __init__(self, history_size: int = 100):
+        self.jobs = {}
+        self._history = deque(maxlen=history_size)
+        self._history_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add_job(self, job: Job):
+        """Register a job; it is picked up by the running loop."""
+        self.jobs[job.name] = job
+        self._wake.set()
+
+    def start(self):
+        """Start the scheduling loop in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the scheduling loop. Runs already in progress finish on their own."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def run_now(self, name: str) -> bool:
+        """
+        Start a job immediately in a background thread.
+
+        Args:
+            name: Name of the job
+
+        Returns:
+            True if the job was started, False if it is already running
+        """
+        job = self.jobs[name]
+        if not job.running.acquire(blocking=False):
+            self._record(job, "skipped", time.time(), time.time(), "previous run still in progress")
+            return False
+        threading.Thread(target=self._run, args=(job,), name=f"job-{name}", daemon=True).start()
+        return True
+
+    def history(self) -> list:
+        """Return the recorded runs, newest first."""
+        with self._history_lock:
+            return list(reversed(self._history))
+
+    def _loop(self):
+        while not self._stop.is_set():
+            now = time.time()
+            for job in list(self.jobs.values()):
+                if job.next_run <= now:
+                    job.next_run = job.compute_next_run()
+                    self.run_now(job.name)
+
+            next_due = min((job.next_run for job in self.jobs.values()), default=now + 60)
+            self._wake.wait(timeout=max(next_due - time.time(), 0.1))
+            self._wake.clear()
+
+    def _run(self, job: Job):
+        started_at = time.time()
+        try:
+            job.func()
+            self._record(job, "success", started_at, time.time())
+        except Exception as e:
+            logger.exception("Error in scheduled job", extra={"job": job.name})
+            self._record(job, "error", started_at, time.time(), str(e))
+        finally:
+            job.running.release()
+
+    def _record(self, job: Job, status: str, started_at: float, finished_at: float, error: str = None):
+        with self._history_lock:
+            self._history.append({
+                "job": job.name,
+                "status": status,
+                "started_at": datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+                "duration_ms": round((finished_at - started_at) * 1000),
+                "error": error,
+            })
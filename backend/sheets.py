@@ -0,0 +1,205 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import gspread
+
+from metrics import SHEETS_THROTTLED, UPSTREAM_CALLS, timed
+
+
+class QuotaExceededError(Exception):
+    """Raised when a Sheets call can't get request budget in time."""
+
+
+class SheetsGateway:
+    """
+    Central access point for Google Sheets API calls.
+
+    Every call is charged to its spreadsheet's per-minute request budget
+    (sliding 60 s window). When the budget is used up, calls wait for it
+    instead of hitting the API and getting 429s. Identical reads that are in
+    flight at the same time share one API call. Calls failing with 429/5xx
+    are retried with exponential backoff and jitter.
+    """
+
+    RETRY_CODES = (429, 500, 502, 503)
+
+    def __init__(self, requests_per_minute: int = 60, retries: int = 4,
+                 backoff: float = 1.0, max_wait: float = 30):
+        """
+        Initialize the gateway.
+
+        Args:
+            requests_per_minute: Request budget per spreadsheet
+            retries: Retries of a call failing with 429/5xx
+            backoff: Delay (seconds) before the first retry, doubled for every next one
+            max_wait: Longest time (seconds) a call waits for budget before failing
+        """
+        self.requests_per_minute = requests_per_minute
+        self.retries = retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._stats = {}
+        self._inflight = {}
+
+    def call(self, spreadsheet_id: str, func, *args, coalesce_key=None, **kwargs):
+        """
+        Run a gspread call within the spreadsheet's budget.
+
+        Args:
+            spreadsheet_id: Spreadsheet the call is charged to
+            func: gspread method to call
+            *args: Positional arguments for func
+            coalesce_key: Key identifying a read; concurrent calls with the
+                same key share one API call
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            The result of func
+        """
+        if coalesce_key is None:
+            return self._call_with_retries(spreadsheet_id, func, args, kwargs)
+
+        key = (spreadsheet_id, coalesce_key)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._stat(spreadsheet_id)["coalesced"] += 1
+
+        if leader:
+            try:
+                future.set_result(self._call_with_retries(spreadsheet_id, func, args, kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        return future.result()
+
+    def usage(self) -> dict:
+        """Return the request budget usage and counters of every spreadsheet."""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for spreadsheet_id, stats in self._stats.items():
+                window = self._windows.get(spreadsheet_id, deque())
+                used = sum(1 for t in window if now - t < 60)
+                result[spreadsheet_id] = dict(stats, used_last_minute=used, limit_per_minute=self.requests_per_minute)
+            return result
+
+    def _stat(self, spreadsheet_id):
+        return self._stats.setdefault(spreadsheet_id, {
+            "requests": 0, "throttled": 0, "coalesced": 0, "retries": 0, "errors": 0
+        })
+
+    def _acquire(self, spreadsheet_id):
+        """Block until the spreadsheet has budget for one more request."""
+        deadline = time.monotonic() + self.max_wait
+        throttled = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                window = self._windows.setdefault(spreadsheet_id, deque())
+                while window and now - window[0] >= 60:
+                    window.popleft()
+                if len(window) < self.requests_per_minute:
+                    window.append(now)
+                    self._stat(spreadsheet_id)["requests"] += 1
+                    return
+                wait = window[0] + 60 - now
+                if not throttled:
+                    self._stat(spreadsheet_id)["throttled"] += 1
+                    SHEETS_THROTTLED.labels(spreadsheet=spreadsheet_id).inc()
+                    throttled = True
+            if now + wait > deadline:
+                raise QuotaExceededError(f"Sheets request budget for {spreadsheet_id} exhausted")
+            time.sleep(wait)
+
+    def _call_with_retries(self, spreadsheet_id, func, args, kwargs):
+        attempt = 0
+        while True:
+            self._acquire(spreadsheet_id)
+            try:
+                with timed("sheets_call", call=getattr(func, "__name__", str(func))):
+                    result = func(*args, **kwargs)
+                UPSTREAM_CALLS.labels(service="sheets", outcome="ok").inc()
+                return result
+            except gspread.exceptions.APIError as e:
+                UPSTREAM_CALLS.labels(service="sheets", outcome=f"http_{e.code}").inc()
+                if e.code not in self.RETRY_CODES or attempt >= self.retries:
+                    with self._lock:
+                        self._stat(spreadsheet_id)["errors"] += 1
+                    raise
+                with self._lock:
+                    self._stat(spreadsheet_id)["retries"] += 1
+                delay = self.backoff * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay / 2))
+                attempt += 1
+
+
+class SheetWriteBatch:
+    """
+    Collects cell updates for a job and commits them together.
+
+    All updates that target the same spreadsheet are sent in a single
+    values_batch_update call, instead of one API call per range.
+    """
+
+    def __init__(self, value_input_option: str = "RAW", gateway: SheetsGateway = None):
+        """
+        Initialize an empty batch.
+
+        Args:
+            value_input_option: How Sheets interprets the values ("RAW" or "USER_ENTERED")
+            gateway: Optional SheetsGateway the commit calls go through
+        """
+        self.value_input_option = value_input_option
+        self.gateway = gateway
+        self._updates = {}
+
+    def update(self, worksheet, range_name: str, values) -> None:
+        """
+        Queue an update of a range of a worksheet.
+
+        Args:
+            worksheet: gspread worksheet the range belongs to
+            range_name: A1 range within the worksheet, e.g. "A7"
+            values: 2D list of values
+        """
+        spreadsheet = worksheet.spreadsheet
+        spreadsheet_updates = self._updates.setdefault(spreadsheet.id, (spreadsheet, []))[1]
+        spreadsheet_updates.append({
+            "range": gspread.utils.absolute_range_name(worksheet.title, range_name),
+            "values": values,
+        })
+
+    def __len__(self) -> int:
+        return sum(len(updates) for _, updates in self._updates.values())
+
+    def commit(self) -> int:
+        """
+        Send all queued updates and empty the batch.
+
+        Returns:
+            Number of API calls made (one per spreadsheet)
+        """
+        calls = 0
+        for spreadsheet, updates in self._updates.values():
+            body = {
+                "valueInputOption": self.value_input_option,
+                "data": updates,
+            }
+            if self.gateway is not None:
+                self.gateway.call(spreadsheet.id, spreadsheet.values_batch_update, body=body)
+            else:
+                spreadsheet.values_batch_update(body=body)
+            calls += 1
+        self._updates = {}
+        return calls
@@ -0,0 +1,70 @@
+import json
+import os
+from typing import Optional
+
+
+class Tenant:
+    """
+    One shop/warehouse served by the dashboard.
+
+    Settings left as None fall back to the single-tenant environment
+    variables (REFURBED_PLIK, M2_M47_PLIK, IDOSELL_API_BASE_URL,
+    IDOSELL_API_KEY).
+    """
+
+    def __init__(self, name: str, record_id: int, orders_sheet_id: Optional[str] = None,
+                 m2_sheet_id: Optional[str] = None, idosell_base_url: Optional[str] = None,
+                 idosell_api_key: Optional[str] = None):
+        """
+        Initialize a tenant.
+
+        Args:
+            name: Unique tenant name, used in ?tenant= query parameters
+            record_id: Id of the tenant's Adam record
+            orders_sheet_id: Key of the Orders/Config/Szukajka spreadsheet
+            m2_sheet_id: Key of the M2 spreadsheet
+            idosell_base_url: Base URL of the tenant's IdoSell admin API
+            idosell_api_key: IdoSell API key of the tenant's shop
+        """
+        self.name = name
+        self.record_id = record_id
+        self.orders_sheet_id = orders_sheet_id
+        self.m2_sheet_id = m2_sheet_id
+        self.idosell_base_url = idosell_base_url
+        self.idosell_api_key = idosell_api_key
+
+    def __repr__(self):
+        return f"Tenant({self.name!r}, record_id={self.record_id})"
+
+
+DEFAULT_TENANT = "default"
+
+
+def load_tenants() -> dict:
+    """
+    Load the tenant registry from TENANTS_JSON.
+
+    TENANTS_JSON is a JSON list of objects with the Tenant fields, e.g.
+    [{"name": "pl", "record_id": 1, "orders_sheet_id": "...", "m2_sheet_id": "...",
+      "idosell_base_url": "https://shop.pl/api/admin/v5", "idosell_api_key": "..."}].
+    Without it there is a single tenant, "default", configured by the
+    environment and stored in record 1.
+
+    Returns:
+        dict: Tenants by name, in the configured order (the first one is the default)
+    """
+    tenants_json = os.environ.get("TENANTS_JSON")
+    if not tenants_json:
+        return {DEFAULT_TENANT: Tenant(DEFAULT_TENANT, 1)}
+
+    tenants = {}
+    for entry in json.loads(tenants_json):
+        tenant = Tenant(**entry)
+        if tenant.name in tenants:
+            raise ValueError(f"Duplicate tenant name {tenant.name}")
+        if any(other.record_id == tenant.record_id for other in tenants.values()):
+            raise ValueError(f"Duplicate tenant record_id {tenant.record_id}")
+        tenants[tenant.name] = tenant
+    if not tenants:
+        raise ValueError("TENANTS_JSON must list at least one tenant")
+    return tenants
@@ -69,11 +69,21 @@ function App() {
     // Fetch data on component mount
     fetchData();
 
-    // Set up interval to fetch data every 5 minutes (300,000 ms)
-    const interval = setInterval(fetchData, 5 * 60 * 1000);
+    // Without EventSource support fall back to polling every 5 minutes
+    if (typeof EventSource === "undefined") {
+      const interval = setInterval(fetchData, 5 * 60 * 1000);
+      return () => clearInterval(interval);
+    }
+
+    // The backend pushes new data whenever it changes
+    const events = new EventSource(`${API_BASE_URL}/stream`);
+    events.addEventListener("adam", (event) => {
+      setData(JSON.parse((event as MessageEvent).data));
+      setError("");
+    });
 
-    // Cleanup interval on component unmount
-    return () => clearInterval(interval);
+    // Close the stream on component unmount
+    return () => events.close();
   }, []);
 
   return (